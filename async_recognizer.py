@@ -0,0 +1,214 @@
+"""Asyncio recognition path for high-concurrency workers.
+
+ACR identify uploads and Netease lookups run as coroutines on one event loop
+(bounded by per-host semaphores); yt-dlp downloads and pydub decode/encode work
+is pushed to an executor. Requires aiohttp, which the threaded MusicRecognizer
+does not need.
+"""
+import os
+import time
+import asyncio
+import tempfile
+from urllib.parse import urlparse
+
+import aiohttp
+from pydub import AudioSegment
+
+from recognizer import MusicRecognizer, UPLOAD_PROFILES, export_for_upload
+from rate_limiter import get_rate_limiter, is_rate_limited, backoff_delay
+from circuit_breaker import get_circuit_breaker
+
+# Default in-flight request caps per remote host, shared by every job on the loop
+DEFAULT_HOST_LIMITS = {"acr": 16, "netease": 8}
+
+_HOST_SEMAPHORES = {}
+
+def _host_semaphore(host, limit):
+    """One semaphore per (event loop, host)"""
+    key = (id(asyncio.get_running_loop()), host)
+    if key not in _HOST_SEMAPHORES:
+        _HOST_SEMAPHORES[key] = asyncio.Semaphore(limit)
+    return _HOST_SEMAPHORES[key]
+
+class AsyncMusicRecognizer(MusicRecognizer):
+    def __init__(self, acr_host, acr_key, acr_secret, netease_api=None, executor=None,
+                 host_limits=None, window_concurrency=8, **kwargs):
+        super().__init__(acr_host, acr_key, acr_secret, netease_api, **kwargs)
+        self.executor = executor
+        self.host_limits = dict(DEFAULT_HOST_LIMITS, **(host_limits or {}))
+        # Windows of one job being encoded/uploaded at once (bounds temp files per job)
+        self.window_concurrency = window_concurrency
+
+    async def _run_blocking(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def _recognize_segment_async(self, http, file_path):
+        """Async twin of _recognize_segment (same token bucket, same backoff)"""
+        if not self.acr_host or not self.acr_key or not self.acr_secret:
+            return {"status": {"code": -1, "msg": "Missing credentials"}}
+
+        limiter = get_rate_limiter(self.acr_key)
+        sem = _host_semaphore(self.acr_host, self.host_limits["acr"])
+        with open(file_path, "rb") as f:
+            sample = f.read()
+
+        for attempt in range(self.rate_limit_retries + 1):
+            await limiter.acquire_async()
+            request_url, data = self._identify_payload(file_path)
+            form = aiohttp.FormData()
+            for k, v in data.items():
+                form.add_field(k, str(v))
+            form.add_field("sample", sample, filename=os.path.basename(file_path))
+            try:
+                async with sem:
+                    async with http.post(request_url, data=form, timeout=aiohttp.ClientTimeout(total=20)) as r:
+                        if r.status == 429:
+                            acr_res = {"status": {"code": 429, "msg": "Too Many Requests"}}
+                        else:
+                            r.raise_for_status()
+                            acr_res = await r.json(content_type=None)
+            except Exception as e:
+                acr_res = {"status": {"code": -1, "msg": str(e)}}
+            if not is_rate_limited(acr_res) or attempt == self.rate_limit_retries:
+                break
+            limiter.backoff(backoff_delay(attempt))
+        if attempt:
+            acr_res["rate_limit_retries"] = attempt
+        return acr_res
+
+    async def _search_netease_async(self, http, title, artist):
+        """Same contract as _search_netease: None = service unavailable"""
+        if not self.netease_api:
+            return []
+        breaker = get_circuit_breaker(self.netease_api)
+        if not breaker.allow():
+            return None
+        keyword = f"{title} {artist}".strip()
+        sem = _host_semaphore(urlparse(self.netease_api).netloc, self.host_limits["netease"])
+        try:
+            async with sem:
+                async with http.get(f"{self.netease_api}/search", params={"keywords": keyword, "limit": 3},
+                                    timeout=aiohttp.ClientTimeout(total=10)) as r:
+                    if r.status >= 500:
+                        breaker.record_failure()
+                        return None
+                    breaker.record_success()
+                    if r.status == 200:
+                        return self._parse_netease_songs(await r.json(content_type=None))
+        except Exception:
+            breaker.record_failure()
+            return None
+        return []
+
+    async def _identify_window_async(self, http, window_sem, audio, start_ms, temp_dir, offset_ms=0, segment_len=15 * 1000):
+        """Encode (executor) + identify (loop) one window. Returns (acr_res, seg_bytes, latency_ms)."""
+        timestamp_ms = offset_ms + start_ms
+        async with window_sem:
+            seg_path, seg_bytes = await self._run_blocking(
+                export_for_upload, audio[start_ms:start_ms + segment_len],
+                os.path.join(temp_dir, f"seg_{timestamp_ms}"), self.upload_profile)
+            t0 = time.time()
+            acr_res = await self._recognize_segment_async(http, seg_path)
+            latency_ms = (time.time() - t0) * 1000
+            try:
+                os.remove(seg_path)
+            except OSError:
+                pass
+        return acr_res, seg_bytes, latency_ms
+
+    async def _scan_audio_async(self, http, audio, temp_dir, results, offset_ms=0):
+        """Identify every window concurrently, then pick winners in timeline order (same as _scan_audio)"""
+        segment_len = 15 * 1000
+        step = 15 * 1000
+        starts = self._window_starts(len(audio), segment_len, step)
+        window_sem = asyncio.Semaphore(self.window_concurrency)
+        responses = await asyncio.gather(*[
+            self._identify_window_async(http, window_sem, audio, i, temp_dir, offset_ms, segment_len) for i in starts
+        ])
+
+        candidates = []
+        last_winner_title = None
+        for i, (acr_res, seg_bytes, latency_ms) in zip(starts, responses):
+            status_code, best_match = self._record_window(
+                acr_res, offset_ms + i, results, last_winner_title, seg_bytes, latency_ms)
+            last_winner_title = self._next_winner_title(status_code, best_match, last_winner_title)
+            if best_match:
+                candidates.append(best_match)
+        return candidates
+
+    async def _finalize_async(self, http, all_candidates, results):
+        """_finalize with the Netease lookups issued concurrently"""
+        prepared = self._prepare_final(all_candidates, results)
+        accepted = [(track, ", ".join([a["name"] for a in track["artists"]])) for track, reason in prepared if not reason]
+        lookups = await asyncio.gather(*[self._search_netease_async(http, track["title"], artist) for track, artist in accepted])
+        netease_raw = results.setdefault("netease_raw", {})
+        for (track, artist_str), matches in zip(accepted, lookups):
+            netease_raw[f"{track['title']}\n{artist_str}"] = matches
+        lookups = iter(lookups)
+        for track, reason in prepared:
+            if reason:
+                results["debug_log"].append(f"Final: {track['title']} ({track['score']}) -> ❌ REJECTED ({reason})",
+                                            "reject")
+                continue
+            self._accept_track(track, next(lookups), results)
+        self._note_netease_status(results)
+
+    async def process_video_async(self, video_url, cookies_path=None, proxy=None, download_mode="full",
+                                  time_ranges=None, sample_plan=None, download_profile=None, max_acr_calls=None,
+                                  quick=None, use_chapters=False, windows_per_chapter=2, session=None):
+        """Coroutine version of process_video (same arguments, same result shape).
+
+        Pass a shared aiohttp `session` to reuse connections across jobs. Budgeted
+        scans (max_acr_calls) and quick mode decide the next window from the previous
+        answer, so they (and the handful of chapter windows) run the threaded scanners
+        in the executor.
+        """
+        if isinstance(self.upload_profile, str) and self.upload_profile not in UPLOAD_PROFILES:
+            return {"error": f"Unknown upload profile: {self.upload_profile}"}
+        try:
+            ydl_opts = self._build_ydl_opts(download_mode, download_profile, time_ranges, sample_plan, proxy, cookies_path)
+        except ValueError as e:
+            return {"error": str(e)}
+
+        results = self._new_results()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # 1. Download (blocking yt-dlp -> executor)
+            try:
+                sections = await self._run_blocking(self._download, video_url, ydl_opts, temp_dir, results, download_mode,
+                                                    self._cache_variant(download_mode, time_ranges, sample_plan))
+            except Exception as e:
+                return {"error": f"Video download failed: {str(e)} \n(提示: 请检查网络或在高级配置中填入有效代理)"}
+
+            # 2. Slice and Recognize, 3. Aggregate, filter and verify
+            http = session or aiohttp.ClientSession()
+            try:
+                all_candidates = []
+                loaded = []
+                chapters = results["download_info"].get("chapters") if use_chapters else None
+                if use_chapters and not chapters:
+                    results["debug_log"].append("📖 No chapters found, falling back to a full scan")
+                for offset_ms, section_path in sections:
+                    audio = await self._run_blocking(AudioSegment.from_file, section_path)
+                    if max_acr_calls or chapters:
+                        loaded.append((offset_ms, audio))
+                    elif quick:
+                        candidates = await self._run_blocking(self._scan_audio, audio, temp_dir, results, offset_ms, quick)
+                        if results.get("early_exit"):
+                            all_candidates = candidates
+                            break
+                        all_candidates.extend(candidates)
+                    else:
+                        all_candidates.extend(await self._scan_audio_async(http, audio, temp_dir, results, offset_ms))
+                if chapters:
+                    all_candidates = await self._run_blocking(self._scan_chapters, loaded, chapters, temp_dir, results, int(windows_per_chapter))
+                elif max_acr_calls:
+                    all_candidates = await self._run_blocking(self._scan_budgeted, loaded, temp_dir, results, int(max_acr_calls))
+                await self._finalize_async(http, all_candidates, results)
+            except Exception as e:
+                return {"error": f"Audio processing failed: {str(e)}", "partial_results": results}
+            finally:
+                if session is None:
+                    await http.close()
+
+        return results
@@ -0,0 +1,145 @@
+"""Downloaded-audio cache with a total-bytes cap and LRU eviction.
+
+Entries are keyed by the canonical video id (extractor + id, resolved offline
+from the URL) plus the download variant (format / sections), so re-running a
+job with new recognition parameters, or after an ACR outage, does not hit
+YouTube again. Each entry is a directory holding the downloaded files and a
+meta.json; `last_used` in the meta drives eviction.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+
+def canonical_video_id(video_url):
+    """'https://youtu.be/<id>' and 'https://www.youtube.com/watch?v=<id>&t=3' -> 'Youtube-<id>'"""
+    from yt_dlp.extractor import gen_extractor_classes
+    for ie in gen_extractor_classes():
+        if ie.suitable(video_url):
+            temp_id = ie.get_temp_id(video_url)
+            if temp_id:
+                return f"{ie.ie_key()}-{temp_id}"
+            break
+    return "url-" + hashlib.sha1(video_url.encode()).hexdigest()[:16]
+
+def _link_or_copy(src, dst):
+    """Hard link when possible (no extra bytes, survives eviction of the entry), else copy"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+class AudioCache:
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, video_url, variant=""):
+        digest = hashlib.sha1(variant.encode()).hexdigest()[:12]
+        return f"{canonical_video_id(video_url)}-{digest}"
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key)
+
+    def _read_meta(self, entry_dir):
+        try:
+            with open(os.path.join(entry_dir, "meta.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, entry_dir, meta):
+        tmp = os.path.join(entry_dir, "meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(entry_dir, "meta.json"))
+
+    def get(self, key, dest_dir):
+        """On a hit, link the cached files into dest_dir.
+
+        Returns (sections, meta) with sections = [(offset_ms, path), ...], or None.
+        """
+        with self._lock:
+            entry_dir = self._entry_dir(key)
+            meta = self._read_meta(entry_dir)
+            if not meta:
+                return None
+            sections = []
+            for offset_ms, name in meta["sections"]:
+                src = os.path.join(entry_dir, name)
+                if not os.path.exists(src):
+                    return None
+                dst = os.path.join(dest_dir, name)
+                if not os.path.exists(dst):
+                    _link_or_copy(src, dst)
+                sections.append((offset_ms, dst))
+            meta["last_used"] = time.time()
+            self._write_meta(entry_dir, meta)
+            return sections, meta
+
+    def put(self, key, sections, info=None):
+        """Store downloaded files ([(offset_ms, path), ...]) plus a small info dict"""
+        total = sum(os.path.getsize(path) for _, path in sections)
+        if total > self.max_bytes:
+            return False
+        with self._lock:
+            # Build the entry next to the cache and rename it in, so readers never see half an entry
+            staging = tempfile.mkdtemp(dir=self.root, prefix=".staging-")
+            try:
+                names = []
+                for n, (offset_ms, path) in enumerate(sections):
+                    name = f"{n}_{os.path.basename(path)}"
+                    _link_or_copy(path, os.path.join(staging, name))
+                    names.append((offset_ms, name))
+                self._write_meta(staging, {"sections": names, "bytes": total, "info": info or {},
+                                           "created": time.time(), "last_used": time.time()})
+                entry_dir = self._entry_dir(key)
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                os.rename(staging, entry_dir)
+            except OSError:
+                shutil.rmtree(staging, ignore_errors=True)
+                return False
+            self._evict()
+            return True
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.root):
+            entry_dir = os.path.join(self.root, name)
+            meta = self._read_meta(entry_dir) if not name.startswith(".") else None
+            if meta:
+                entries.append((meta.get("last_used", 0), meta.get("bytes", 0), entry_dir))
+        return entries
+
+    def total_bytes(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+def get_audio_cache():
+    """Process-wide cache from AUDIO_CACHE_DIR / AUDIO_CACHE_MAX_BYTES (0 disables it)"""
+    global _CACHE
+    max_bytes = int(os.environ.get("AUDIO_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+    if max_bytes <= 0:
+        return None
+    root = os.environ.get("AUDIO_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "video_music_audio_cache")
+    with _CACHE_LOCK:
+        if _CACHE is None or _CACHE.root != root or _CACHE.max_bytes != max_bytes:
+            _CACHE = AudioCache(root, max_bytes)
+        return _CACHE
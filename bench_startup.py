@@ -0,0 +1,80 @@
+"""Benchmark cold-start import cost of the entry modules.
+
+Usage: python bench_startup.py [module ...] [--runs N] [--top N] [--max-ms MS]
+
+Each run imports the module in a fresh interpreter with `-X importtime` and
+reports the median cumulative import time, the heaviest imports it pulled in,
+and which of the heavy dependencies (yt_dlp, pydub, requests, aiohttp) got
+loaded eagerly. With --max-ms the exit code is 1 when a module's median is
+over budget, so CI can track startup regressions.
+"""
+import os
+import sys
+import json
+import statistics
+import subprocess
+
+DEFAULT_MODULES = ["recognizer", "webapp.app", "video_music_recognizer"]
+HEAVY_MODULES = ["yt_dlp", "pydub", "requests", "aiohttp"]
+
+def import_once(module):
+    """One fresh-interpreter import -> (cumulative_us, {imported module: cumulative_us}, heavy modules loaded)"""
+    code = (f"import sys, json; import {module}; "
+            f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line.split("|")
+        try:
+            cumulative[parts[2].strip()] = int(parts[1])
+        except ValueError:
+            continue  # header line
+    heavy = json.loads(proc.stdout.strip().splitlines()[-1])
+    return cumulative.get(module, 0), cumulative, heavy
+
+def bench_module(module, runs=5, top=8):
+    totals, last = [], {}
+    for _ in range(runs):
+        total_us, last, heavy = import_once(module)
+        totals.append(total_us)
+    # `site` (interpreter startup) is paid by every process, not by the module
+    heaviest = sorted(((us, name) for name, us in last.items() if name not in (module, "site")), reverse=True)[:top]
+    return {
+        "module": module,
+        "median_ms": round(statistics.median(totals) / 1000, 1),
+        "min_ms": round(min(totals) / 1000, 1),
+        "heavy_loaded": heavy,
+        "heaviest": [{"module": name, "ms": round(us / 1000, 1)} for us, name in heaviest],
+    }
+
+def main():
+    args = sys.argv[1:]
+    if "-h" in args or "--help" in args:
+        print(__doc__)
+        return
+    options = {"runs": 5, "top": 8}
+    max_ms = None
+    for flag in ("--runs", "--top", "--max-ms"):
+        if flag in args:
+            i = args.index(flag)
+            value = float(args[i + 1])
+            del args[i:i + 2]
+            if flag == "--max-ms":
+                max_ms = value
+            else:
+                options[flag[2:]] = int(value)
+    modules = args or DEFAULT_MODULES
+
+    reports = [bench_module(m, **options) for m in modules]
+    print(f"{'module':<24} {'median_ms':>10} {'min_ms':>8}  heavy deps loaded")
+    for r in reports:
+        print(f"{r['module']:<24} {r['median_ms']:>10} {r['min_ms']:>8}  {', '.join(r['heavy_loaded']) or '-'}")
+    print(json.dumps(reports, ensure_ascii=False))
+    if max_ms is not None and any(r["median_ms"] > max_ms for r in reports):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Benchmark ACR upload profiles: upload bytes and identify latency vs. match score.
+
+Usage: python bench_upload_profiles.py <audio_file> [profile ...] [--windows N]
+Reads ACR_HOST / ACR_ACCESS_KEY / ACR_ACCESS_SECRET from the environment.
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+from pydub import AudioSegment
+from recognizer import MusicRecognizer, UPLOAD_PROFILES, export_for_upload
+
+def bench_profile(recognizer, audio, profile, windows, segment_len=15 * 1000):
+    rows = []
+    with tempfile.TemporaryDirectory() as td:
+        for n, start in enumerate(range(0, len(audio) - segment_len + 1, segment_len)):
+            if n >= windows:
+                break
+            path, size = export_for_upload(audio[start:start + segment_len], os.path.join(td, f"seg_{start}"), profile)
+            t0 = time.time()
+            res = recognizer._recognize_segment(path)
+            latency_ms = (time.time() - t0) * 1000
+            music = res.get("metadata", {}).get("music", []) if res.get("status", {}).get("code") == 0 else []
+            top = max(music, key=lambda m: m.get("score", 0)) if music else {}
+            rows.append({"start_ms": start, "bytes": size, "latency_ms": round(latency_ms, 1),
+                         "status": res.get("status", {}).get("code"), "acrid": top.get("acrid"), "score": top.get("score", 0)})
+    return rows
+
+def summarize(profile, rows, baseline=None):
+    n = len(rows) or 1
+    latencies = sorted(r["latency_ms"] for r in rows) or [0]
+    summary = {
+        "profile": profile,
+        "windows": len(rows),
+        "avg_bytes": sum(r["bytes"] for r in rows) // n,
+        "avg_latency_ms": round(sum(latencies) / n, 1),
+        "p95_latency_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "avg_score": round(sum(r["score"] for r in rows) / n, 1),
+        "matched": sum(1 for r in rows if r["acrid"]),
+    }
+    if baseline:
+        # Same acrid as the baseline profile on the same window
+        same = sum(1 for r, b in zip(rows, baseline) if r["acrid"] and r["acrid"] == b["acrid"])
+        summary["agrees_with_baseline"] = same
+    return summary
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        print(__doc__)
+        return
+    windows = 10
+    if "--windows" in args:
+        i = args.index("--windows")
+        windows = int(args[i + 1])
+        del args[i:i + 2]
+    audio_path, profiles = args[0], args[1:] or ["original", "compact", "tiny"]
+
+    recognizer = MusicRecognizer(os.environ.get("ACR_HOST", ""), os.environ.get("ACR_ACCESS_KEY", ""),
+                                 os.environ.get("ACR_ACCESS_SECRET", ""))
+    audio = AudioSegment.from_file(audio_path)
+
+    baseline = None
+    summaries = []
+    for profile in profiles:
+        if profile not in UPLOAD_PROFILES:
+            print(f"Unknown profile: {profile}")
+            continue
+        rows = bench_profile(recognizer, audio, profile, windows)
+        summaries.append(summarize(profile, rows, baseline))
+        baseline = baseline or rows
+
+    print(f"{'profile':<10} {'avg_bytes':>10} {'avg_ms':>8} {'p95_ms':>8} {'score':>6} {'matched':>8} {'agree':>6}")
+    for s in summaries:
+        print(f"{s['profile']:<10} {s['avg_bytes']:>10} {s['avg_latency_ms']:>8} {s['p95_latency_ms']:>8} "
+              f"{s['avg_score']:>6} {s['matched']:>8} {s.get('agrees_with_baseline', '-'):>6}")
+    print(json.dumps(summaries, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Circuit breaker for the Netease verification service.
+
+One breaker per Netease API base, shared by every job in the process. After
+`failure_threshold` consecutive failures (connect errors, timeouts, 5xx) the
+circuit opens and lookups fail fast instead of each waiting for the timeout.
+After `reset_timeout` seconds one half-open probe is let through: success
+closes the circuit, failure opens it again.
+"""
+import os
+import time
+import threading
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, half_open_max=1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max = half_open_max
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self.short_circuited = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and time.time() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self):
+        """May a call go out now? Open circuits refuse until reset_timeout, then admit probes."""
+        with self._lock:
+            if self._state == OPEN and time.time() - self._opened_at >= self.reset_timeout:
+                self._state, self._probes = HALF_OPEN, 0
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes < self.half_open_max:
+                self._probes += 1
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state, self._failures, self._probes = CLOSED, 0, 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state, self._opened_at, self._probes = OPEN, time.time(), 0
+
+    def snapshot(self):
+        state = self.state
+        with self._lock:
+            return {"state": state, "consecutive_failures": self._failures, "short_circuited": self.short_circuited}
+
+_BREAKERS = {}
+_BREAKERS_LOCK = threading.Lock()
+
+def get_circuit_breaker(name):
+    """Process-wide breaker for a service (e.g. the Netease API base URL).
+
+    Thresholds come from NETEASE_BREAKER_FAILURES (default 5) and
+    NETEASE_BREAKER_RESET seconds (default 30).
+    """
+    with _BREAKERS_LOCK:
+        breaker = _BREAKERS.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(int(os.environ.get("NETEASE_BREAKER_FAILURES", 5)),
+                                     float(os.environ.get("NETEASE_BREAKER_RESET", 30)))
+            _BREAKERS[name] = breaker
+        return breaker
@@ -0,0 +1,274 @@
+"""Continuous recognition of live streams.
+
+process_video() needs a finite file; a live stream never ends. Here yt-dlp only
+resolves the stream URL, ffmpeg decodes it to mono 16 kHz PCM on a pipe, and a
+reader thread cuts the PCM into `step`-sized chunks. The main loop keeps just
+the last `segment_len` of audio, identifies it with the normal ACR path and
+turns the per-window winners into track-change events with wall-clock times.
+
+Memory stays flat over hours: the chunk queue and the window are fixed size,
+logs/raw responses are ring buffers, and each window's upload file is deleted
+right after the identify call (one temp dir per run, removed on exit).
+
+Usage: python live_recognizer.py <url> [--max-seconds N] [--confirm N] [--step SEC]
+                                 [--proxy URL] [--cookies FILE]
+Prints one JSON event per line. Reads ACR_HOST / ACR_ACCESS_KEY / ACR_ACCESS_SECRET.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import tempfile
+import threading
+import subprocess
+from collections import deque
+from datetime import datetime, timezone
+
+import yt_dlp
+from pydub import AudioSegment
+
+from recognizer import MusicRecognizer, SILENCE_DBFS
+from records import JobLog
+
+LIVE_SAMPLE_RATE = 16000
+LIVE_BYTES_PER_MS = LIVE_SAMPLE_RATE * 2 // 1000  # s16le mono
+LIVE_LOG_SIZE = 200  # debug_log / acr_raw entries kept in memory
+
+def wall_clock(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec="seconds")
+
+class LiveMusicRecognizer(MusicRecognizer):
+    def _resolve_stream(self, video_url, cookies_path=None, proxy=None):
+        """Media URL + HTTP headers of the live stream's audio (no download)"""
+        ydl_opts = self._build_ydl_opts(proxy=proxy, cookies_path=cookies_path)
+        ydl_opts.pop('postprocessors', None)
+        # Live HLS usually has no audio-only format; ffmpeg drops the video track
+        ydl_opts['format'] = "bestaudio/best"
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with yt_dlp.YoutubeDL(self._isolate_cookies(ydl_opts, temp_dir)) as ydl:
+                info = ydl.extract_info(video_url, download=False)
+        fmt = next((f for f in info.get('requested_formats') or [] if f.get('acodec') != 'none'), info)
+        return {
+            "url": fmt["url"],
+            "http_headers": fmt.get("http_headers") or info.get("http_headers") or {},
+            "is_live": bool(info.get("is_live")),
+            "title": info.get("title"),
+        }
+
+    def _ffmpeg_cmd(self, stream):
+        headers = "".join(f"{k}: {v}\r\n" for k, v in stream["http_headers"].items())
+        cmd = [AudioSegment.converter, "-hide_banner", "-loglevel", "error", "-nostdin"]
+        if stream["url"].startswith("http"):
+            cmd += ["-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "10"]
+            if headers:
+                cmd += ["-headers", headers]
+        return cmd + ["-i", stream["url"], "-vn", "-ac", "1", "-ar", str(LIVE_SAMPLE_RATE), "-f", "s16le", "pipe:1"]
+
+    def _ffmpeg_env(self, proxy=None):
+        """Proxy for this ffmpeg process only (os.environ is left alone, see _download_attempts)"""
+        env = dict(os.environ)
+        if proxy is not None:
+            for name in ("http_proxy", "https_proxy", "HTTP_PROXY", "HTTPS_PROXY"):
+                env.pop(name, None)
+            if proxy:
+                env["http_proxy"] = env["https_proxy"] = proxy
+        return env
+
+    def _put_latest(self, chunks, item, stats):
+        """Queue `item`; if recognition fell behind real time, drop the oldest chunk
+        instead of blocking, so the queue never grows and the reader never hangs"""
+        while True:
+            try:
+                chunks.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    _, _, dropped = chunks.get_nowait()
+                    stats["dropped_ms"] += len(dropped or b"") // LIVE_BYTES_PER_MS
+                except queue.Empty:
+                    pass
+
+    def _read_chunks(self, proc, chunks, chunk_bytes, stats):
+        """Reader thread: PCM pipe -> (arrival time, stream position at chunk end, data)
+        chunks, then a None end marker. The position counts every chunk read, including
+        ones _put_latest drops later, so it stays on the real stream timeline."""
+        try:
+            while True:
+                data = proc.stdout.read(chunk_bytes)
+                if len(data) < chunk_bytes:
+                    break
+                stats["read_ms"] += chunk_bytes // LIVE_BYTES_PER_MS
+                self._put_latest(chunks, (time.time(), stats["read_ms"], data), stats)
+        except (OSError, ValueError):
+            pass  # pipe closed by _stop_stream
+        finally:
+            self._put_latest(chunks, (time.time(), stats["read_ms"], None), stats)
+
+    def _start_stream(self, video_url, cookies_path, proxy, chunks, chunk_bytes, stats):
+        stream = self._resolve_stream(video_url, cookies_path, proxy)
+        proc = subprocess.Popen(self._ffmpeg_cmd(stream), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                stdin=subprocess.DEVNULL, env=self._ffmpeg_env(proxy))
+        reader = threading.Thread(target=self._read_chunks, args=(proc, chunks, chunk_bytes, stats), daemon=True)
+        reader.start()
+        return stream, proc, reader
+
+    def _stop_stream(self, proc, reader):
+        if proc.poll() is None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+        proc.stdout.close()
+        reader.join(timeout=5)
+
+    def watch_live(self, video_url, cookies_path=None, proxy=None, segment_len=15 * 1000, step=None,
+                   confirm=2, max_seconds=None, max_reconnects=5, results=None):
+        """Generator of events for a live stream, until it ends, `max_seconds` of
+        stream time have been read, or the caller closes the generator.
+
+        A new track is reported after `confirm` consecutive windows agree on it
+        (one stray match does not flip the current track); `confirm` windows
+        without music end the current track. Events:
+          {"event": "track_change", "title", "artist", "acrid", "score", "started_at",
+           "stream_offset_ms", "previous", "external_links"}
+          {"event": "track_end", "title", "acrid", "ended_at", "stream_offset_ms"}
+          {"event": "stream_reconnect" / "stream_end", ...}
+        `results` (optional dict) receives running counters and ring-buffered logs.
+        """
+        step = step or segment_len
+        window_bytes = segment_len * LIVE_BYTES_PER_MS
+        chunk_bytes = step * LIVE_BYTES_PER_MS
+        # Enough queued chunks for one window plus slack; anything older is dropped
+        chunks = queue.Queue(maxsize=segment_len // step + 2)
+
+        if results is None:
+            results = {}
+        results.update(self._new_results())
+        results["debug_log"] = JobLog(LIVE_LOG_SIZE)
+        results["acr_raw"] = deque(maxlen=LIVE_LOG_SIZE)
+        # stream_ms: audio recognized; read_ms: audio read (stream_ms + dropped_ms, the
+        # timeline stream_offset_ms is on); failed_windows: ACR errors, no evidence either way
+        stats = results["live"] = {"started_at": wall_clock(time.time()), "stream_ms": 0, "read_ms": 0,
+                                   "dropped_ms": 0, "silent_windows": 0, "failed_windows": 0,
+                                   "reconnects": 0, "track_changes": 0}
+
+        window = bytearray()
+        current = None  # track being played
+        pending = []  # consecutive winners that disagree with `current`
+        misses = 0
+        window_end_ms = None  # stream position of the window's last chunk
+        last_winner_title = None
+        reconnects = 0
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            stream, proc, reader = self._start_stream(video_url, cookies_path, proxy, chunks, chunk_bytes, stats)
+            try:
+                while max_seconds is None or stats["stream_ms"] < max_seconds * 1000:
+                    arrived, position_ms, data = chunks.get()
+                    if data is None:
+                        # ffmpeg exited: the broadcast ended, or the HLS URL expired / network hiccup
+                        self._stop_stream(proc, reader)
+                        if not stream["is_live"] or reconnects >= max_reconnects:
+                            break
+                        reconnects += 1
+                        stats["reconnects"] += 1
+                        time.sleep(min(2 ** reconnects, 30))
+                        try:
+                            stream, proc, reader = self._start_stream(video_url, cookies_path, proxy, chunks, chunk_bytes, stats)
+                        except Exception as e:
+                            yield {"event": "stream_end", "at": wall_clock(time.time()), "reason": str(e)}
+                            return
+                        yield {"event": "stream_reconnect", "at": wall_clock(time.time()), "attempt": reconnects}
+                        window.clear()
+                        continue
+
+                    if position_ms - step != window_end_ms:
+                        # Chunks were dropped (recognition fell behind): don't splice across the gap
+                        window.clear()
+                    window_end_ms = position_ms
+                    window += data
+                    del window[:-window_bytes]
+                    stats["stream_ms"] += step
+                    if len(window) < window_bytes:
+                        continue
+                    reconnects = 0
+
+                    timestamp_ms = position_ms - segment_len
+                    window_wall = arrived - segment_len / 1000
+                    audio = AudioSegment(data=bytes(window), sample_width=2, frame_rate=LIVE_SAMPLE_RATE, channels=1)
+                    if audio.dBFS < SILENCE_DBFS:
+                        # Ad breaks / "starting soon" screens: no ACR call
+                        stats["silent_windows"] += 1
+                        best_match = None
+                    else:
+                        acr_res, seg_bytes, latency_ms = self._identify_window(audio, 0, temp_dir, timestamp_ms, segment_len)
+                        status_code, best_match = self._record_window(acr_res, timestamp_ms, results, last_winner_title,
+                                                                      seg_bytes, latency_ms)
+                        last_winner_title = self._next_winner_title(status_code, best_match, last_winner_title)
+                        if status_code not in (0, 1001):
+                            # Timeout / exhausted rate limit: neither a miss nor a match,
+                            # so it must not end the current track or break a pending run
+                            stats["failed_windows"] += 1
+                            continue
+                        if best_match and self._reject_reason(best_match["title"]):
+                            best_match = None
+
+                    if best_match and current and best_match["acrid"] == current["acrid"]:
+                        pending, misses = [], 0
+                        continue
+                    if not best_match:
+                        pending = []
+                        misses += 1
+                        if current and misses >= confirm:
+                            yield {"event": "track_end", "title": current["title"], "acrid": current["acrid"],
+                                   "ended_at": wall_clock(window_wall - (misses - 1) * step / 1000),
+                                   "stream_offset_ms": timestamp_ms - (misses - 1) * step}
+                            current = None
+                        continue
+
+                    misses = 0
+                    pending = pending + [(best_match, window_wall)] if pending and pending[-1][0]["acrid"] == best_match["acrid"] else [(best_match, window_wall)]
+                    if len(pending) < confirm:
+                        continue
+                    first, started = pending[0]
+                    track = max((m for m, _ in pending), key=lambda m: m["score"])
+                    artist_str = ", ".join([a["name"] for a in track["artists"]])
+                    stats["track_changes"] += 1
+                    yield {"event": "track_change", "title": track["title"], "artist": artist_str,
+                           "acrid": track["acrid"], "score": track["score"], "started_at": wall_clock(started),
+                           "stream_offset_ms": first["timestamp_ms"],
+                           "previous": current["title"] if current else None,
+                           "external_links": self._generate_external_links(track["title"], artist_str)}
+                    current, pending = track, []
+                yield {"event": "stream_end", "at": wall_clock(time.time()), "stream_ms": stats["stream_ms"]}
+            finally:
+                self._stop_stream(proc, reader)
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        print(__doc__)
+        return
+    options = {}
+    for flag, key, cast in (("--max-seconds", "max_seconds", float), ("--confirm", "confirm", int),
+                            ("--step", "step", lambda v: int(float(v) * 1000)),
+                            ("--proxy", "proxy", str), ("--cookies", "cookies_path", str)):
+        if flag in args:
+            i = args.index(flag)
+            options[key] = cast(args[i + 1])
+            del args[i:i + 2]
+
+    recognizer = LiveMusicRecognizer(os.environ.get("ACR_HOST", ""), os.environ.get("ACR_ACCESS_KEY", ""),
+                                     os.environ.get("ACR_ACCESS_SECRET", ""))
+    events = recognizer.watch_live(args[0], **options)
+    try:
+        for event in events:
+            print(json.dumps(event, ensure_ascii=False), flush=True)
+    except KeyboardInterrupt:
+        events.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""HTTP load test for the web tier (webapp/app.py) against local stubs.
+
+Usage: python loadtest.py [--submitters N] [--pollers N] [--duration S] [--submit-interval S]
+                          [--poll-interval S] [--media-seconds S] [--acr-latency-ms MS]
+                          [--netease-latency-ms MS] [--server flask|gunicorn] [--threads N]
+                          [--json report.json]
+
+Starts one stub server standing in for ACRCloud (POST /v1/identify), the Netease
+API (GET /search) and the video host (GET /media/<id>.wav, a generated tone),
+then the web app in a subprocess pointed at it. Nothing leaves the machine.
+
+Submitter threads POST /result (each with a fresh media URL, so the audio cache
+never short-circuits a download) and poller threads GET /api/status for the jobs
+submitted so far. Reported: per-endpoint throughput, p50/p95/p99 latency and error
+rate, job outcomes, and per-second request counts with the server's RSS (Linux /proc).
+"""
+import io
+import os
+import sys
+import json
+import math
+import time
+import wave
+import random
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import subprocess
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Songs the ACR stub "recognizes"; Netease stub answers with the same titles
+CATALOGUE = [
+    {"title": "Stub Song A", "artist": "Stub Artist", "acrid": "stub-a"},
+    {"title": "Stub Song B", "artist": "Another Stub", "acrid": "stub-b"},
+    {"title": "Stub Song C", "artist": "Stub Trio", "acrid": "stub-c"},
+]
+
+DEFAULTS = {
+    "submitters": 2, "pollers": 8, "duration": 30.0, "submit_interval": 1.0, "poll_interval": 0.5,
+    "media_seconds": 60, "acr_latency_ms": 300, "netease_latency_ms": 50, "server": "flask", "threads": 16,
+}
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def tone_wav(seconds, rate=16000):
+    """Mono 16-bit sine sweep, loud enough to pass the silence filter"""
+    samples = (int(9000 * math.sin(2 * math.pi * (220 + 40 * (n // rate % 8)) * n / rate)) for n in range(seconds * rate))
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"".join(struct.pack("<h", s) for s in samples))
+    return buf.getvalue()
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Set on the server class by start_stubs()
+    media = b""
+    acr_latency = 0.3
+    netease_latency = 0.05
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body, content_type="application/json", head=False):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        url = urlparse(self.path)
+        if url.path.startswith("/media/"):
+            return self._send(self.media, "audio/wav", head)
+        if url.path == "/search":
+            time.sleep(self.netease_latency)
+            keywords = parse_qs(url.query).get("keywords", [""])[0]
+            songs = [{"id": n, "name": s["title"], "artists": [{"name": s["artist"]}], "album": {"name": "Stub Album"}}
+                     for n, s in enumerate(CATALOGUE) if s["title"] in keywords]
+            return self._send(json.dumps({"result": {"songs": songs}}).encode(), head=head)
+        self.send_error(404)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if urlparse(self.path).path != "/v1/identify":
+            return self.send_error(404)
+        time.sleep(self.acr_latency * random.uniform(0.5, 1.5))
+        song = random.choice(CATALOGUE)
+        body = {"status": {"code": 0, "msg": "Success"}, "metadata": {"music": [{
+            "title": song["title"], "artists": [{"name": song["artist"]}], "acrid": song["acrid"], "score": 95}]}}
+        self._send(json.dumps(body).encode())
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections are expected under load
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+def start_stubs(options):
+    handler = type("Handler", (StubHandler,), {
+        "media": tone_wav(int(options["media_seconds"])),
+        "acr_latency": options["acr_latency_ms"] / 1000,
+        "netease_latency": options["netease_latency_ms"] / 1000,
+    })
+    server = StubServer(("127.0.0.1", free_port()), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def start_app(options, port, work_dir):
+    env = dict(os.environ,
+               JOB_STORE_DIR=os.path.join(work_dir, "jobs"),
+               AUDIO_CACHE_DIR=os.path.join(work_dir, "audio_cache"),
+               ACR_RATE_LIMIT_DIR=work_dir,
+               ACR_RATE_LIMIT_QPS=os.environ.get("ACR_RATE_LIMIT_QPS", "1000"),
+               PYTHONUNBUFFERED="1")
+    if options["server"] == "gunicorn":
+        # One worker: JOBS lives in process memory, so pollers must hit the same process
+        cmd = [sys.executable, "-m", "gunicorn", "-w", "1", "--threads", str(options["threads"]),
+               "-b", f"127.0.0.1:{port}", "--chdir", os.path.join(ROOT, "webapp"), "app:app"]
+    else:
+        cmd = [sys.executable, "-c", "import sys; sys.path.insert(0, 'webapp'); from app import app; "
+               f"app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                            stderr=open(os.path.join(work_dir, "server.log"), "w"))
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"web app exited early, see {work_dir}/server.log")
+        try:
+            if requests.get(f"{base}/healthz", timeout=1).ok:
+                return proc, base
+        except requests.RequestException:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("web app did not come up within 30s")
+
+def process_rss_kb(pid):
+    """RSS of pid and its descendants in KiB (0 where /proc is unavailable)"""
+    total, stack = 0, [pid]
+    while stack:
+        p = stack.pop()
+        try:
+            with open(f"/proc/{p}/status") as f:
+                total += next((int(line.split()[1]) for line in f if line.startswith("VmRSS:")), 0)
+            with open(f"/proc/{p}/task/{p}/children") as f:
+                stack.extend(int(c) for c in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return total
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}          # endpoint -> [latency_ms, ...]
+        self.errors = {}           # endpoint -> count
+        self.timeline = {}         # second -> requests completed
+        self.started = time.time()
+
+    def record(self, endpoint, latency_ms, ok):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append(latency_ms)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            second = int(time.time() - self.started)
+            self.timeline[second] = self.timeline.get(second, 0) + 1
+
+    def timed(self, endpoint, method, url, **kwargs):
+        t0 = time.time()
+        try:
+            response = method(url, timeout=30, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        self.record(endpoint, (time.time() - t0) * 1000, ok)
+        return response
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(math.ceil(pct / 100 * len(ordered))) - 1)] if ordered else None
+
+def submitter(base, stub, options, recorder, job_ids, stop):
+    session = requests.Session()
+    while not stop.is_set():
+        response = recorder.timed("submit", session.post, f"{base}/result", data={
+            "url": f"{stub}/media/{random.getrandbits(64):x}.wav",
+            "acr_host": stub, "acr_key": "loadtest", "acr_secret": "loadtest",
+            "netease_api": stub, "download_mode": "fingerprint",
+        })
+        if response is not None and response.ok:
+            job_ids.append(response.json()["job_id"])
+        stop.wait(options["submit_interval"])
+
+def job_outcome(status):
+    # "done" jobs can still carry a pipeline error (download / ACR failure)
+    return "failed" if status.get("error") else status["status"]
+
+def poller(base, options, recorder, job_ids, outcomes, stop):
+    session = requests.Session()
+    while not stop.is_set():
+        if job_ids:
+            job_id = random.choice(job_ids)
+            response = recorder.timed("status", session.get, f"{base}/api/status/{job_id}")
+            if response is not None and response.ok:
+                outcomes[job_id] = job_outcome(response.json())
+        stop.wait(options["poll_interval"])
+
+def run(options):
+    work_dir = tempfile.mkdtemp(prefix="vmr_loadtest_")
+    stub_server, stub = start_stubs(options)
+    proc, base = start_app(options, free_port(), work_dir)
+    recorder, job_ids, outcomes, stop = Recorder(), [], {}, threading.Event()
+    rss = []
+    try:
+        threads = [threading.Thread(target=submitter, args=(base, stub, options, recorder, job_ids, stop))
+                   for _ in range(options["submitters"])]
+        threads += [threading.Thread(target=poller, args=(base, options, recorder, job_ids, outcomes, stop))
+                    for _ in range(options["pollers"])]
+        for t in threads:
+            t.start()
+        end = time.time() + options["duration"]
+        while time.time() < end:
+            rss.append((round(time.time() - recorder.started, 1), process_rss_kb(proc.pid)))
+            time.sleep(1)
+        stop.set()
+        for t in threads:
+            t.join()
+        # Final status of every job (unpolled ones included)
+        for job_id in job_ids:
+            response = requests.get(f"{base}/api/status/{job_id}", timeout=10)
+            outcomes[job_id] = job_outcome(response.json()) if response.ok else "lost"
+        rss.append((round(time.time() - recorder.started, 1), process_rss_kb(proc.pid)))
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        stub_server.shutdown()
+
+    elapsed = options["duration"]
+    endpoints = {}
+    for endpoint, latencies in sorted(recorder.samples.items()):
+        errors = recorder.errors.get(endpoint, 0)
+        endpoints[endpoint] = {
+            "requests": len(latencies),
+            "rps": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 50), 1),
+            "p95_ms": round(percentile(latencies, 95), 1),
+            "p99_ms": round(percentile(latencies, 99), 1),
+            "error_rate": round(errors / len(latencies), 4),
+        }
+    jobs = {}
+    for status in outcomes.values():
+        jobs[status] = jobs.get(status, 0) + 1
+    report = {
+        "options": options,
+        "endpoints": endpoints,
+        "jobs": jobs,
+        "timeline": [{"second": s, "requests": recorder.timeline.get(int(s), 0), "rss_kb": kb} for s, kb in rss],
+    }
+    shutil.rmtree(work_dir, ignore_errors=True)
+    return report
+
+def print_report(report):
+    print(f"{'endpoint':<10} {'requests':>9} {'rps':>8} {'p50_ms':>9} {'p95_ms':>9} {'p99_ms':>9} {'errors':>8}")
+    for endpoint, r in report["endpoints"].items():
+        print(f"{endpoint:<10} {r['requests']:>9} {r['rps']:>8} {r['p50_ms']:>9} {r['p95_ms']:>9} "
+              f"{r['p99_ms']:>9} {r['error_rate'] * 100:>7.2f}%")
+    print("jobs:", ", ".join(f"{k}={v}" for k, v in sorted(report["jobs"].items())) or "-")
+    print(f"{'t_s':>6} {'req/s':>6} {'rss_mb':>8}")
+    for point in report["timeline"]:
+        print(f"{point['second']:>6} {point['requests']:>6} {point['rss_kb'] / 1024:>8.1f}")
+
+def main():
+    args = sys.argv[1:]
+    if "-h" in args or "--help" in args:
+        print(__doc__)
+        return
+    options = dict(DEFAULTS)
+    json_path = None
+    for key, default in DEFAULTS.items():
+        flag = "--" + key.replace("_", "-")
+        if flag in args:
+            i = args.index(flag)
+            options[key] = type(default)(args[i + 1])
+            del args[i:i + 2]
+    if "--json" in args:
+        i = args.index("--json")
+        json_path = args[i + 1]
+        del args[i:i + 2]
+
+    report = run(options)
+    print_report(report)
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Recognition of local recordings (files or whole directories), no download stage.
+
+Decoding and window encoding are CPU bound, so they run in a process pool sized
+to the CPU count; each worker writes a file's upload windows to disk and hands
+back their paths. The parent owns the single recognizer: every ACR call goes
+through its per-key rate limiter (see rate_limiter.py) from one small thread
+pool, then the usual selection / aggregation / Netease verification runs per file.
+
+Only a few decoded files wait at a time, so temp disk usage stays bounded even
+when decoding is much faster than the ACR quota allows.
+
+Usage: python local_recognizer.py <file|dir> [...] [--workers N] [--threads N] [--output results.jsonl]
+Prints (or appends) one JSON line per file. Reads ACR_HOST / ACR_ACCESS_KEY /
+ACR_ACCESS_SECRET / NETEASE_API_BASE / ACR_UPLOAD_PROFILE.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import mimetypes
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from pydub import AudioSegment
+
+from recognizer import MusicRecognizer, SILENCE_DBFS, export_for_upload
+from records import to_jsonable
+
+# Containers ffmpeg decodes that mimetypes does not know as audio/video everywhere
+MEDIA_EXTENSIONS = {".mp3", ".m4a", ".aac", ".wav", ".flac", ".ogg", ".opus", ".webm", ".mkv", ".mp4", ".mov", ".wma"}
+
+def is_media_file(path):
+    ext = os.path.splitext(path)[1].lower()
+    mime = mimetypes.guess_type(path)[0] or ""
+    return ext in MEDIA_EXTENSIONS or mime.startswith(("audio/", "video/"))
+
+def expand_media_paths(paths):
+    """Files as given, directories walked recursively (sorted, media files only)"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend(os.path.join(root, n) for n in sorted(names) if is_media_file(n))
+        else:
+            files.append(path)
+    return list(dict.fromkeys(files))
+
+def decode_windows(path, out_dir, upload_profile, segment_len=15 * 1000, step=15 * 1000):
+    """Process-pool worker: decode `path` and export its upload windows into out_dir.
+
+    Returns {"duration_ms", "windows": [(timestamp_ms, seg_path, seg_bytes), ...],
+    "silent_windows"} or {"error"}. Top-level so it can be pickled.
+    """
+    try:
+        audio = AudioSegment.from_file(path)
+    except Exception as e:
+        return {"error": f"Decode failed: {e}"}
+    os.makedirs(out_dir, exist_ok=True)
+    windows, silent = [], 0
+    for start in range(0, len(audio), step):
+        if start + segment_len > len(audio):
+            break
+        segment = audio[start:start + segment_len]
+        if segment.dBFS < SILENCE_DBFS:
+            silent += 1
+            continue
+        seg_path, seg_bytes = export_for_upload(segment, os.path.join(out_dir, f"seg_{start}"), upload_profile)
+        windows.append((start, seg_path, seg_bytes))
+    return {"duration_ms": len(audio), "windows": windows, "silent_windows": silent}
+
+class LocalMusicRecognizer(MusicRecognizer):
+    def _identify_file(self, seg_path):
+        t0 = time.time()
+        acr_res = self._recognize_segment(seg_path)
+        return acr_res, (time.time() - t0) * 1000
+
+    def _recognize_decoded(self, path, decoded, backend):
+        """ACR + aggregation for one decoded file (windows identified concurrently on `backend`)"""
+        results = self._new_results()
+        results["file"] = path
+        if "error" in decoded:
+            return {"file": path, "error": decoded["error"], "partial_results": results}
+        results["local"] = {"duration_ms": decoded["duration_ms"], "silent_windows": decoded["silent_windows"]}
+
+        windows = decoded["windows"]
+        responses = backend.map(self._identify_file, [seg_path for _, seg_path, _ in windows])
+        candidates = []
+        last_winner_title = None
+        for (timestamp_ms, seg_path, seg_bytes), (acr_res, latency_ms) in zip(windows, responses):
+            status_code, best_match = self._record_window(acr_res, timestamp_ms, results, last_winner_title,
+                                                          seg_bytes, latency_ms)
+            last_winner_title = self._next_winner_title(status_code, best_match, last_winner_title)
+            if best_match:
+                candidates.append(best_match)
+        self._finalize(candidates, results)
+        return results
+
+    def process_files(self, paths, workers=None, recognize_threads=4, max_pending=None):
+        """Generator of per-file results (process_video's shape plus "file"), in
+        completion order. `paths` may mix files and directories.
+
+        workers: decode processes (default: CPU count). recognize_threads: concurrent
+        ACR uploads, still paced by the shared rate limiter. max_pending: decoded or
+        decoding files held at once (default 2 * workers), bounds temp disk usage.
+        """
+        files = expand_media_paths(paths)
+        workers = workers or os.cpu_count() or 1
+        max_pending = max_pending or 2 * workers
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                ProcessPoolExecutor(max_workers=workers) as decoders, \
+                ThreadPoolExecutor(max_workers=recognize_threads) as backend:
+            queued = list(enumerate(files))
+            decoding = {}
+            while queued or decoding:
+                while queued and len(decoding) < max_pending:
+                    n, path = queued.pop(0)
+                    out_dir = os.path.join(temp_dir, str(n))
+                    decoding[decoders.submit(decode_windows, path, out_dir, self.upload_profile)] = (path, out_dir)
+                done, _ = wait(decoding, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    path, out_dir = decoding.pop(fut)
+                    try:
+                        decoded = fut.result()
+                    except Exception as e:  # worker crashed (e.g. killed by the OOM killer)
+                        decoded = {"error": f"Decode failed: {e}"}
+                    try:
+                        yield self._recognize_decoded(path, decoded, backend)
+                    finally:
+                        shutil.rmtree(out_dir, ignore_errors=True)
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        print(__doc__)
+        return
+    options = {}
+    for flag, key in (("--workers", "workers"), ("--threads", "recognize_threads")):
+        if flag in args:
+            i = args.index(flag)
+            options[key] = int(args[i + 1])
+            del args[i:i + 2]
+    output = None
+    if "--output" in args:
+        i = args.index("--output")
+        output = args[i + 1]
+        del args[i:i + 2]
+
+    recognizer = LocalMusicRecognizer(os.environ.get("ACR_HOST", ""), os.environ.get("ACR_ACCESS_KEY", ""),
+                                      os.environ.get("ACR_ACCESS_SECRET", ""),
+                                      netease_api=os.environ.get("NETEASE_API_BASE", "http://localhost:3000"),
+                                      upload_profile=os.environ.get("ACR_UPLOAD_PROFILE", "original"))
+    out = open(output, "a", encoding="utf-8") if output else sys.stdout
+    try:
+        for result in recognizer.process_files(args, **options):
+            out.write(json.dumps(to_jsonable(result), ensure_ascii=False) + "\n")
+            out.flush()
+    finally:
+        if output:
+            out.close()
+
+if __name__ == "__main__":
+    main()
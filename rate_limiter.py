@@ -0,0 +1,133 @@
+"""Token-bucket rate limiting for ACRCloud identify calls.
+
+One bucket per ACR access key, shared by every job in the process. When `fcntl`
+is available the bucket state lives in a small lock-protected file, so gunicorn
+workers (separate processes) on the same host queue on the same quota too.
+"""
+import os
+import json
+import time
+import random
+import hashlib
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to a process-local bucket
+    fcntl = None
+
+# ACRCloud "slow down" codes: 3003 = limit exceeded, 3015 = QPS limit exceeded (+ plain HTTP 429)
+RATE_LIMIT_CODES = {3003, 3015, 429}
+
+def is_rate_limited(acr_res):
+    return (acr_res or {}).get("status", {}).get("code") in RATE_LIMIT_CODES
+
+def backoff_delay(attempt, base=1.0, cap=30.0):
+    """Exponential backoff with jitter: ~1s, 2s, 4s ... capped at `cap`"""
+    delay = min(cap, base * (2 ** attempt))
+    return delay * (0.5 + random.random() / 2)
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None, state_path=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(rate, 1))
+        self.state_path = state_path if fcntl else None
+        self._lock = threading.Lock()
+        self._state = {"tokens": self.capacity, "updated": time.time(), "blocked_until": 0.0}
+
+    def _load(self, fh):
+        if fh is None:
+            return dict(self._state)
+        fh.seek(0)
+        try:
+            return json.loads(fh.read() or "{}") or dict(self._state)
+        except ValueError:
+            return dict(self._state)
+
+    def _save(self, fh, state):
+        if fh is None:
+            self._state = state
+            return
+        fh.seek(0)
+        fh.truncate()
+        fh.write(json.dumps(state))
+        fh.flush()
+
+    def _update(self, fn):
+        """Run fn(state) -> result under the thread lock (and the file lock when shared)"""
+        with self._lock:
+            if not self.state_path:
+                state = self._load(None)
+                result = fn(state)
+                self._save(None, state)
+                return result
+            with open(self.state_path, "a+") as fh:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+                try:
+                    state = self._load(fh)
+                    result = fn(state)
+                    self._save(fh, state)
+                    return result
+                finally:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _try_take(self, tokens):
+        """Take tokens if possible; returns 0 on success, else seconds to wait"""
+        def take(state):
+            now = time.time()
+            state["tokens"] = min(self.capacity, state["tokens"] + (now - state["updated"]) * self.rate)
+            state["updated"] = now
+            if now < state.get("blocked_until", 0):
+                return state["blocked_until"] - now
+            if state["tokens"] >= tokens:
+                state["tokens"] -= tokens
+                return 0
+            return (tokens - state["tokens"]) / self.rate
+        return self._update(take)
+
+    def acquire(self, tokens=1, timeout=None):
+        """Block until `tokens` are available. Returns False if `timeout` expires first."""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            wait = self._try_take(tokens)
+            if wait <= 0:
+                return True
+            if deadline is not None and time.time() + wait > deadline:
+                return False
+            time.sleep(min(wait, 1.0))
+
+    async def acquire_async(self, tokens=1):
+        """asyncio flavour of acquire(): waits on the event loop instead of blocking a thread"""
+        import asyncio
+        while True:
+            wait = self._try_take(tokens)
+            if wait <= 0:
+                return True
+            await asyncio.sleep(min(wait, 1.0))
+
+    def backoff(self, seconds):
+        """Pause every caller of this bucket (the server told us to slow down)"""
+        def block(state):
+            state["blocked_until"] = max(state.get("blocked_until", 0), time.time() + seconds)
+        self._update(block)
+
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+def get_rate_limiter(access_key, rate=None, capacity=None):
+    """Process-wide (and, with fcntl, host-wide) bucket for an ACR access key.
+
+    Defaults come from ACR_RATE_LIMIT_QPS / ACR_RATE_LIMIT_BURST; the shared state
+    file goes to ACR_RATE_LIMIT_DIR (default: the system temp dir).
+    """
+    rate = float(rate or os.environ.get("ACR_RATE_LIMIT_QPS", 5))
+    capacity = float(capacity or os.environ.get("ACR_RATE_LIMIT_BURST", rate))
+    with _LIMITERS_LOCK:
+        limiter = _LIMITERS.get(access_key)
+        if limiter is None or limiter.rate != rate or limiter.capacity != capacity:
+            key_hash = hashlib.sha1((access_key or "").encode()).hexdigest()[:16]
+            state_dir = os.environ.get("ACR_RATE_LIMIT_DIR") or tempfile.gettempdir()
+            limiter = TokenBucket(rate, capacity, os.path.join(state_dir, f"acr_ratelimit_{key_hash}.json"))
+            _LIMITERS[access_key] = limiter
+        return limiter
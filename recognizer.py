@@ -3,31 +3,277 @@ import time
 import hmac
 import hashlib
 import base64
+import re
 import json
-import requests
+import shutil
 import tempfile
+import threading
 import mimetypes
-from pydub import AudioSegment
-import yt_dlp
+import uuid
+from collections import deque
+from rate_limiter import get_rate_limiter, is_rate_limited, backoff_delay
+from audio_cache import get_audio_cache
+from circuit_breaker import get_circuit_breaker
+from records import Candidate, TrackRecord, JobLog, acr_requests, compact_acr_response
+
+# yt_dlp, pydub and requests are imported where they are used: together they cost
+# ~200ms at import time, which every cold start (health check, index page) paid.
+
+def warm_up(extractors=False):
+    """Load the heavy modules ahead of the first job (see WARMUP_ON_START in webapp/app.py).
+
+    extractors=True also builds yt-dlp's extractor list, which the first URL
+    lookup would otherwise pay for. Returns the seconds spent.
+    """
+    t0 = time.time()
+    import requests  # noqa: F401
+    import pydub  # noqa: F401
+    import yt_dlp
+    if extractors:
+        yt_dlp.extractor.gen_extractor_classes()
+    return time.time() - t0
+
+# yt-dlp format selectors per download mode.
+# - "full": largest audio stream, transcoded to MP3 (original behaviour)
+# - "fingerprint": smallest stream that is still good enough for ACR fingerprinting,
+#   kept in its native container (webm/m4a/opus) and decoded directly, no MP3 re-encode.
+DOWNLOAD_FORMATS = {
+    "full": "bestaudio/best",
+    "fingerprint": "worstaudio[abr>=48]/bestaudio[abr<=96]/worstaudio/bestaudio/best",
+}
+
+# Named high-throughput download profiles (see download_profile_opts)
+DOWNLOAD_PROFILES = {
+    "default": {},
+    # DASH/HLS: fetch fragments in parallel instead of one by one
+    "fast": {"concurrent_fragments": 8},
+    # Hand the transfer to aria2c (multi-connection); yt-dlp falls back to native if it is not installed
+    "aria2c": {"concurrent_fragments": 8, "external_downloader": "aria2c",
+               "external_downloader_args": ["-x", "8", "-s", "8", "-k", "1M"]},
+}
+
+def download_profile_opts(profile=None):
+    """Translate a download profile into yt-dlp options.
+
+    profile: a DOWNLOAD_PROFILES name or a dict with any of
+    concurrent_fragments (int), external_downloader (str), external_downloader_args (list)
+    and rate_limit (bytes/s, or a yt-dlp size string such as "2M").
+    """
+    if not profile:
+        return {}
+    if isinstance(profile, str):
+        if profile not in DOWNLOAD_PROFILES:
+            raise ValueError(f"Unknown download profile: {profile}")
+        profile = DOWNLOAD_PROFILES[profile]
+
+    opts = {}
+    if profile.get("concurrent_fragments"):
+        opts["concurrent_fragment_downloads"] = int(profile["concurrent_fragments"])
+    if profile.get("external_downloader"):
+        opts["external_downloader"] = {"default": profile["external_downloader"]}
+        if profile.get("external_downloader_args"):
+            opts["external_downloader_args"] = {"default": list(profile["external_downloader_args"])}
+    rate_limit = profile.get("rate_limit")
+    if rate_limit:
+        import yt_dlp
+        opts["ratelimit"] = yt_dlp.utils.parse_bytes(rate_limit) if isinstance(rate_limit, str) else int(rate_limit)
+    return opts
+
+def download_throughput(download_bytes, download_seconds):
+    """Average download throughput in KB/s"""
+    if not download_bytes or download_seconds <= 0:
+        return 0.0
+    return round(download_bytes / 1024 / download_seconds, 1)
+
+# Encodings used for the per-window ACR upload. Fingerprinting only needs a narrow band,
+# so mono / downsampled / low-bitrate uploads match just as well at a fraction of the bytes.
+UPLOAD_PROFILES = {
+    "original": {"format": "mp3", "channels": None, "frame_rate": None, "bitrate": None},  # source rate/channels
+    "wav": {"format": "wav", "channels": None, "frame_rate": None, "bitrate": None},
+    "compact": {"format": "mp3", "channels": 1, "frame_rate": 16000, "bitrate": "48k"},
+    "tiny": {"format": "mp3", "channels": 1, "frame_rate": 8000, "bitrate": "24k"},
+}
+
+def export_for_upload(segment, path_base, profile=None):
+    """Encode an AudioSegment for upload; returns (path, bytes written).
+
+    profile: an UPLOAD_PROFILES name or dict; `path_base` gets the profile's extension.
+    """
+    if isinstance(profile, str) or profile is None:
+        if (profile or "original") not in UPLOAD_PROFILES:
+            raise ValueError(f"Unknown upload profile: {profile}")
+        profile = UPLOAD_PROFILES[profile or "original"]
+    if profile.get("channels"):
+        segment = segment.set_channels(profile["channels"])
+    if profile.get("frame_rate"):
+        segment = segment.set_frame_rate(profile["frame_rate"])
+    fmt = profile.get("format") or "mp3"
+    path = f"{path_base}.{fmt}"
+    segment.export(path, format=fmt, bitrate=profile.get("bitrate"))
+    return path, os.path.getsize(path)
+
+_DESCRIPTION_TIMESTAMP = re.compile(r"^\s*[\[(]?((?:\d{1,2}:)?\d{1,2}:\d{2})[\])]?\s*[-–—|:.]?\s*(.+?)\s*$")
+
+def parse_description_chapters(description, duration=None):
+    """Timestamped tracklist in a video description -> yt-dlp style chapters.
+
+    "00:00 Intro\n03:15 Song - Artist" -> [{"start_time": 0, "end_time": 195, "title": "Intro"}, ...]
+    At least two ascending timestamps are required, otherwise [] is returned.
+    """
+    entries = []
+    for line in (description or "").splitlines():
+        m = _DESCRIPTION_TIMESTAMP.match(line)
+        if not m:
+            continue
+        seconds = 0
+        for part in m.group(1).split(":"):
+            seconds = seconds * 60 + int(part)
+        if entries and seconds <= entries[-1][0]:
+            continue
+        entries.append((seconds, m.group(2)))
+    if len(entries) < 2:
+        return []
+    chapters = []
+    for n, (start, title) in enumerate(entries):
+        end = entries[n + 1][0] if n + 1 < len(entries) else (duration or start)
+        if end > start:
+            chapters.append({"start_time": start, "end_time": end, "title": title})
+    return chapters
+
+# Aggregation / filtering knobs (overridable per recognizer and per reprocess run)
+DEFAULT_FILTER_PARAMS = {
+    "min_score": 30,            # Filter 1: base ACR score for a window candidate
+    "netease_min_score": 40,    # below this score a Netease match is required
+    # Explicit Blacklist (Expanded based on feedback; added "Pop Danthology")
+    "blacklist": ["E.V.C", "Audio", "Unknown", "Track", "Test", "ä", "å", "è", "é", "ç", "ð", "Mashup", "Remix", "Bootleg", "Mix", "+", "Ludacris", "lo-lo-lo", "Pop Danthology"],
+    # Mojibake Detection
+    "suspicious_chars": ["Ã", "â", "ä", "å", "ç", "è", "é", "ð", "ñ", "ò", "ó", "ô", "õ", "ö"],
+    "title_dedup": True,        # merge "Stay" / "Stay (Remix)" / "Stay - Artist"
+}
+
+def external_links(title, artist):
+    """Generate search links for various platforms"""
+    import urllib.parse
+    query = f"{title} {artist}".strip()
+    encoded_query = urllib.parse.quote(query)
+    
+    return [
+        {
+            "platform": "网易云音乐",
+            "url": f"https://music.163.com/#/search/m/?s={encoded_query}",
+            "icon": "N" # Simplified icon key
+        },
+        {
+            "platform": "QQ音乐",
+            "url": f"https://y.qq.com/n/ryqq/search?w={encoded_query}",
+            "icon": "Q"
+        },
+        {
+            "platform": "Spotify",
+            "url": f"https://open.spotify.com/search/{encoded_query}",
+            "icon": "S"
+        },
+        {
+            "platform": "YouTube",
+            "url": f"https://www.youtube.com/results?search_query={encoded_query}",
+            "icon": "Y"
+        }
+    ]
+
+# Local silence gate: windows quieter than this are never worth an ACR call
+SILENCE_DBFS = -50.0
+
+# Request hedging (MusicRecognizer(hedge=...)): when an identify call is still out
+# after the host's observed p95, a duplicate goes to the same or an alternate host
+DEFAULT_HEDGE = {
+    "percentile": 95,      # hedge after this latency percentile of recent calls
+    "min_samples": 20,     # no hedging until the host has this much history
+    "budget": 0.1,         # extra requests allowed, as a fraction of primary requests
+    "max_hedges": None,    # optional absolute cap per recognizer
+    "hosts": [],           # alternate regional hosts; empty = duplicate to the same host
+}
+
+class LatencyWindow:
+    """Recent identify latencies (seconds) of one ACR host, shared by every job in the process"""
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, p, min_samples=1):
+        with self._lock:
+            samples = sorted(self.samples)
+        if len(samples) < max(min_samples, 1):
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+_LATENCY_WINDOWS = {}
+_LATENCY_LOCK = threading.Lock()
+
+def latency_window(host):
+    with _LATENCY_LOCK:
+        return _LATENCY_WINDOWS.setdefault(host, LatencyWindow())
+
+def _estimate_format_bytes(fmt, duration):
+    """Best-effort size of a yt-dlp format entry (bytes)"""
+    size = fmt.get("filesize") or fmt.get("filesize_approx")
+    if not size and fmt.get("tbr") and duration:
+        size = fmt["tbr"] * 1000 / 8 * duration
+    return int(size or 0)
+
+def _sample_plan_ranges(sample_plan):
+    """yt-dlp `download_ranges` callback for a sampling plan.
+
+    sample_plan: {"every": seconds between section starts, "length": seconds per section}.
+    The ranges are computed from the video duration once yt-dlp has extracted it.
+    """
+    every = float(sample_plan.get("every", 600))
+    length = float(sample_plan.get("length", 60))
+
+    def ranges(info_dict, ydl):
+        duration = info_dict.get("duration")
+        if not duration:
+            # Unknown duration (e.g. some live VODs): fall back to the whole file
+            yield {}
+            return
+        start = 0.0
+        while start < duration:
+            yield {"start_time": start, "end_time": min(start + length, duration)}
+            start += every
+
+    return ranges
 
 class MusicRecognizer:
-    def __init__(self, acr_host, acr_key, acr_secret, netease_api=None):
+    def __init__(self, acr_host, acr_key, acr_secret, netease_api=None, upload_profile="original", rate_limit_retries=4,
+                 filter_params=None, hedge=None, retain_raw=False):
         self.acr_host = acr_host
         self.acr_key = acr_key
         self.acr_secret = acr_secret
+        self.upload_profile = upload_profile
+        self.rate_limit_retries = rate_limit_retries
+        self.filter_params = dict(DEFAULT_FILTER_PARAMS, **(filter_params or {}))
+        # retain_raw: keep full ACR responses / matches (debugging); by default only the
+        # compact fields reprocess() needs are kept, see records.py
+        self.retain_raw = retain_raw
         self.netease_api = netease_api or "http://localhost:3000"
+        # hedge: None (off), True (DEFAULT_HEDGE) or a dict overriding DEFAULT_HEDGE keys
+        self.hedge = dict(DEFAULT_HEDGE, **(hedge if isinstance(hedge, dict) else {})) if hedge else None
+        self.hedge_stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "skipped_budget": 0, "skipped_rate_limit": 0}
+        self._hedge_lock = threading.Lock()
 
     def _generate_acr_signature(self, http_method, uri, access_key, data_type, signature_version, timestamp):
         string_to_sign = f"{http_method}\n{uri}\n{access_key}\n{data_type}\n{signature_version}\n{timestamp}"
         sign = base64.b64encode(hmac.new(self.acr_secret.encode('ascii'), string_to_sign.encode('ascii'), digestmod=hashlib.sha1).digest()).decode('ascii')
         return sign
 
-    def _recognize_segment(self, file_path):
-        """Identify a single audio segment using ACRCloud V1"""
-        if not self.acr_host or not self.acr_key or not self.acr_secret:
-            return {"status": {"code": -1, "msg": "Missing credentials"}}
-
-        request_url = f"https://{self.acr_host}/v1/identify"
+    def _identify_payload(self, file_path, host=None):
+        """URL and signed form fields for an ACRCloud V1 identify request (fresh timestamp)"""
+        host = host or self.acr_host
+        # A host with an explicit scheme (e.g. http://127.0.0.1:8001) targets a local stub
+        request_url = f"{host}/v1/identify" if "://" in host else f"https://{host}/v1/identify"
         http_method = "POST"
         http_uri = "/v1/identify"
         data_type = "audio"
@@ -37,10 +283,7 @@ class MusicRecognizer:
         string_to_sign = f"{http_method}\n{http_uri}\n{self.acr_key}\n{data_type}\n{signature_version}\n{timestamp}"
         sign = base64.b64encode(hmac.new(self.acr_secret.encode('ascii'), string_to_sign.encode('ascii'), digestmod=hashlib.sha1).digest()).decode('ascii')
 
-        f = open(file_path, "rb")
         sample_bytes = os.path.getsize(file_path)
-
-        files = {'sample': f}
         data = {
             'access_key': self.acr_key,
             'sample_bytes': sample_bytes,
@@ -49,365 +292,988 @@ class MusicRecognizer:
             'data_type': data_type,
             'signature_version': signature_version
         }
+        return request_url, data
 
+    def _identify_request(self, file_path, timeout=20, host=None):
+        """One signed ACRCloud V1 identify request (fresh timestamp and upload body)"""
+        import requests
+        request_url, data = self._identify_payload(file_path, host)
+        t0 = time.time()
         try:
-            r = requests.post(request_url, files=files, data=data, timeout=20)
+            with open(file_path, "rb") as f:
+                r = requests.post(request_url, files={'sample': f}, data=data, timeout=timeout)
+            if r.status_code == 429:
+                return {"status": {"code": 429, "msg": "Too Many Requests"}}
             r.raise_for_status()
+            latency_window(host or self.acr_host).add(time.time() - t0)
             return r.json()
         except Exception as e:
             return {"status": {"code": -1, "msg": str(e)}}
+
+    def _reserve_hedge(self):
+        """Count one hedge against the budget (fraction of primary requests + absolute cap).
+        Returns the host to send it to, or None when the budget is spent."""
+        with self._hedge_lock:
+            stats = self.hedge_stats
+            over_ratio = stats["hedged"] + 1 > self.hedge["budget"] * stats["requests"]
+            over_cap = self.hedge["max_hedges"] is not None and stats["hedged"] >= self.hedge["max_hedges"]
+            if over_ratio or over_cap:
+                stats["skipped_budget"] += 1
+                return None
+            stats["hedged"] += 1
+            hosts = self.hedge["hosts"] or [self.acr_host]
+            return hosts[(stats["hedged"] - 1) % len(hosts)]
+
+    def _identify_hedged(self, file_path):
+        """_identify_request, plus a duplicate request if the first one is slower than
+        the host's observed p95; the first real answer wins"""
+        with self._hedge_lock:
+            self.hedge_stats["requests"] += 1
+        threshold = latency_window(self.acr_host).percentile(self.hedge["percentile"], self.hedge["min_samples"])
+        if threshold is None:
+            return self._identify_request(file_path)
+
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        pool = ThreadPoolExecutor(max_workers=2)
+        try:
+            primary = pool.submit(self._identify_request, file_path)
+            done, _ = wait([primary], timeout=threshold)
+            if done:
+                return primary.result()
+            hedge_host = self._reserve_hedge()
+            if not hedge_host:
+                return primary.result()
+            # The duplicate spends quota too: it needs a token right now, it never queues
+            if not get_rate_limiter(self.acr_key).acquire(timeout=0):
+                with self._hedge_lock:
+                    self.hedge_stats["hedged"] -= 1
+                    self.hedge_stats["skipped_rate_limit"] += 1
+                return primary.result()
+            secondary = pool.submit(self._identify_request, file_path, host=hedge_host)
+            pending = {primary, secondary}
+            while True:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                # A transport error only wins if the other request failed as well
+                answered = [f for f in done if f.result().get("status", {}).get("code") != -1]
+                if answered or not pending:
+                    fut = answered[0] if answered else done.pop()
+                    res = fut.result()
+                    res["acr_requests"] = 2  # the duplicate was sent either way
+                    if fut is secondary:
+                        with self._hedge_lock:
+                            self.hedge_stats["hedge_wins"] += 1
+                        res["hedged_via"] = hedge_host
+                    return res
         finally:
-            f.close()
+            # The losing request finishes in the background; its answer is dropped
+            pool.shutdown(wait=False)
+
+    def _recognize_segment(self, file_path):
+        """Identify a single audio segment using ACRCloud V1.
+
+        Calls queue on the shared per-key token bucket; rate-limit responses
+        pause the bucket and are retried with backoff instead of being dropped.
+        The response's "acr_requests" counts every request sent for it (retries
+        and hedged duplicates included).
+        """
+        if not self.acr_host or not self.acr_key or not self.acr_secret:
+            return {"status": {"code": -1, "msg": "Missing credentials"}, "acr_requests": 0}
+
+        limiter = get_rate_limiter(self.acr_key)
+        sent = 0
+        for attempt in range(self.rate_limit_retries + 1):
+            limiter.acquire()
+            acr_res = self._identify_hedged(file_path) if self.hedge else self._identify_request(file_path)
+            sent += acr_res.get("acr_requests", 1)
+            if not is_rate_limited(acr_res) or attempt == self.rate_limit_retries:
+                break
+            limiter.backoff(backoff_delay(attempt))
+        if attempt:
+            acr_res["rate_limit_retries"] = attempt
+        acr_res["acr_requests"] = sent
+        return acr_res
 
     def _generate_external_links(self, title, artist):
         """Generate search links for various platforms"""
-        import urllib.parse
-        query = f"{title} {artist}".strip()
-        encoded_query = urllib.parse.quote(query)
-        
-        return [
-            {
-                "platform": "网易云音乐",
-                "url": f"https://music.163.com/#/search/m/?s={encoded_query}",
-                "icon": "N" # Simplified icon key
-            },
-            {
-                "platform": "QQ音乐",
-                "url": f"https://y.qq.com/n/ryqq/search?w={encoded_query}",
-                "icon": "Q"
-            },
-            {
-                "platform": "Spotify",
-                "url": f"https://open.spotify.com/search/{encoded_query}",
-                "icon": "S"
-            },
-            {
-                "platform": "YouTube",
-                "url": f"https://www.youtube.com/results?search_query={encoded_query}",
-                "icon": "Y"
-            }
-        ]
+        return external_links(title, artist)
 
     def _search_netease(self, title, artist):
-        """Search Netease Cloud Music for the song"""
+        """Search Netease Cloud Music for the song.
+
+        Returns a list of matches ([] = the service answered, no match), or None
+        when the service is unavailable (error, timeout, or the shared circuit
+        breaker is open and the call was skipped without waiting).
+        """
         if not self.netease_api:
             return []
-        
+
+        breaker = get_circuit_breaker(self.netease_api)
+        if not breaker.allow():
+            return None
+        import requests
         keyword = f"{title} {artist}".strip()
         try:
             url = f"{self.netease_api}/search"
             params = {"keywords": keyword, "limit": 3}
             r = requests.get(url, params=params, timeout=10)
-            if r.status_code == 200:
-                data = r.json()
-                songs = data.get("result", {}).get("songs", [])
-                return [{
-                    "name": s.get("name"),
-                    "artists": ", ".join([a["name"] for a in s.get("artists", [])]),
-                    "album": s.get("album", {}).get("name"),
-                    "id": s.get("id")
-                } for s in songs]
         except Exception:
-            pass
+            breaker.record_failure()
+            return None
+        if r.status_code >= 500:
+            breaker.record_failure()
+            return None
+        breaker.record_success()
+        if r.status_code == 200:
+            try:
+                return self._parse_netease_songs(r.json())
+            except ValueError:
+                pass
         return []
 
-    def process_video(self, video_url, cookies_path=None, proxy=None):
-        """Main entry point: Download -> Slice -> Recognize -> Search"""
+    def _parse_netease_songs(self, data):
+        songs = data.get("result", {}).get("songs", [])
+        return [{
+            "name": s.get("name"),
+            "artists": ", ".join([a["name"] for a in s.get("artists", [])]),
+            "album": s.get("album", {}).get("name"),
+            "id": s.get("id")
+        } for s in songs]
+
+    def _pick_best_match(self, acr_res, timestamp_ms, last_winner_title=None):
+        """Filter one ACR response and pick ONE best match for the slice.
+
+        Returns (best_match or None, segment_logs).
+        """
+        matches = acr_res.get("metadata", {}).get("music", [])
+
+        segment_logs = []
+        valid_candidates = []
+
+        for music in matches:
+            title = music.get("title")
+            score = music.get("score", 0)
+
+            # Filter 1: Base Score
+            if score < self.filter_params["min_score"]:
+                continue
+
+            artists = music.get("artists", [])
+            valid_candidates.append(Candidate(
+                title=title,
+                artists=artists if self.retain_raw else [{"name": a.get("name")} for a in artists],
+                acrid=music.get("acrid"),
+                score=score,
+                timestamp_ms=timestamp_ms,
+                raw_match=music if self.retain_raw else None
+            ))
+
+        if not valid_candidates:
+            # No valid candidates (all low score)
+            return None, segment_logs
+
+        # Sort key:
+        # 1. Score (Highest)
+        # 2. Continuity (Matches previous winner)
+        # 3. Title Length (Shortest) - heuristic for "Original" vs "Remix"
+        valid_candidates.sort(key=lambda x: (
+            x["score"],
+            1 if x["title"] == last_winner_title else 0,
+            -len(x["title"])
+        ), reverse=True)
+
+        best_match = valid_candidates[0]
+
+        # Log the winner
+        segment_logs.append(f"✅ {best_match['title']}({best_match['score']})")
+
+        # Log skipped high-score candidates (for debugging/user visibility)
+        if len(valid_candidates) > 1:
+            skipped_titles = [c['title'] for c in valid_candidates[1:]]
+            segment_logs.append(f"[Skipped: {'; '.join(skipped_titles)}]")
+
+        return best_match, segment_logs
+
+    def _record_window(self, acr_res, timestamp_ms, results, last_winner_title=None, seg_bytes=0, latency_ms=0.0):
+        """Account and log one identify response. Returns (status_code, best_match or None)."""
+        results["segments_processed"] += 1
+        # Raw response kept for reprocess(): re-aggregation with new rules, no ACR calls
+        results.setdefault("acr_raw", []).append({"timestamp_ms": timestamp_ms,
+                                                  "response": acr_res if self.retain_raw else compact_acr_response(acr_res)})
+        upload = results.setdefault("upload", {"profile": self.upload_profile, "bytes": 0, "latency_ms": 0.0})
+        upload["bytes"] += seg_bytes
+        upload["latency_ms"] += latency_ms
+
+        status_code = acr_res.get('status', {}).get('code')
+        time_str = f"{timestamp_ms//1000//60:02d}:{timestamp_ms//1000%60:02d}"
+        log_entry = f"[{time_str}] Status: {status_code}"
+
+        best_match = None
+        if status_code == 0:
+            best_match, segment_logs = self._pick_best_match(acr_res, timestamp_ms, last_winner_title)
+            log_entry += " | " + "; ".join(segment_logs)
+        else:
+            log_entry += f" | Msg: {acr_res.get('status', {}).get('msg')}"
+        if acr_res.get("rate_limit_retries"):
+            log_entry += f" (rate limited, retried {acr_res['rate_limit_retries']}x)"
+
+        results["debug_log"].append(log_entry, "info" if status_code in (0, 1001) else "warning")
+        return status_code, best_match
+
+    def _recognize_window(self, audio, start_ms, temp_dir, results, offset_ms=0, last_winner_title=None, segment_len=15 * 1000):
+        """Export, identify and log a single window of `audio`.
+
+        `start_ms` is relative to `audio`; `offset_ms` maps it back to the video timeline.
+        Returns (status_code, best_match or None).
+        """
+        timestamp_ms = offset_ms + start_ms
+        acr_res, seg_bytes, latency_ms = self._identify_window(audio, start_ms, temp_dir, timestamp_ms, segment_len)
+        return self._record_window(acr_res, timestamp_ms, results, last_winner_title, seg_bytes, latency_ms)
+
+    def _identify_window(self, audio, start_ms, temp_dir, timestamp_ms, segment_len=15 * 1000):
+        """Encode + identify one window without logging. Returns (acr_res, seg_bytes, latency_ms)."""
+        segment = audio[start_ms:start_ms + segment_len]
+        seg_path, seg_bytes = export_for_upload(segment, os.path.join(temp_dir, f"seg_{timestamp_ms}"), self.upload_profile)
+
+        t0 = time.time()
+        acr_res = self._recognize_segment(seg_path)
+        latency_ms = (time.time() - t0) * 1000
+        try:
+            os.remove(seg_path)
+        except OSError:
+            pass
+        return acr_res, seg_bytes, latency_ms
+
+    def _window_starts(self, total_len, segment_len=15 * 1000, step=15 * 1000):
+        """Window start positions (ms) covering `total_len`; the trailing partial window is skipped"""
+        return [i for i in range(0, total_len, step) if i + segment_len <= total_len]
+
+    def _scan_audio(self, audio, temp_dir, results, offset_ms=0, quick=None):
+        """Scan `audio` window by window and return the winning candidate of each window.
+
+        quick: optional {"agree": N, "min_score": S}. The scan stops as soon as N
+        consecutive windows agree on the same acrid with score >= S, and the
+        agreeing run is recorded in results["early_exit"].
+        """
+        # To save time/quota, we use a stride.
+        # - Segment length: 15s
+        # - Stride:
+        #   - Continuous scanning (step = 15s) to ensure we don't miss short songs in a medley.
+        segment_len = 15 * 1000
+        step = 15 * 1000  # No gaps, continuous coverage
+
+        candidates = []
+        last_winner_title = None
+        run = []  # consecutive agreeing winners (quick mode)
+
+        for i in self._window_starts(len(audio), segment_len, step):
+            status_code, best_match = self._recognize_window(
+                audio, i, temp_dir, results, offset_ms=offset_ms,
+                last_winner_title=last_winner_title, segment_len=segment_len)
+            last_winner_title = self._next_winner_title(status_code, best_match, last_winner_title)
+            if best_match:
+                # Only add the winner to candidates
+                candidates.append(best_match)
+
+            if quick:
+                if best_match and best_match["score"] >= quick.get("min_score", 70):
+                    run = run + [best_match] if run and run[-1]["acrid"] == best_match["acrid"] else [best_match]
+                else:
+                    run = []
+                if len(run) >= quick.get("agree", 3):
+                    stop_ms = offset_ms + i + segment_len
+                    results["early_exit"] = {"acrid": best_match["acrid"], "title": best_match["title"],
+                                             "stopped_at_ms": stop_ms, "windows": len(run)}
+                    results["debug_log"].append(
+                        f"⚡ Quick mode: stopped at {stop_ms//1000//60:02d}:{stop_ms//1000%60:02d} after "
+                        f"{len(run)} agreeing windows ({best_match['title']}, acrid {best_match['acrid']})")
+                    # Single-song result: best scoring window of the run, timestamped at the run start
+                    track = max(run, key=lambda c: c["score"]).copy(timestamp_ms=run[0]["timestamp_ms"])
+                    return [track]
+
+        return candidates
+
+    def _scan_budgeted(self, sections, temp_dir, results, max_calls):
+        """Scan at most `max_calls` windows, chosen by priority.
+
+        sections: [(offset_ms, AudioSegment), ...]. Windows the local gate marks as
+        silent are never sent. The budget is spent on (1) an evenly spread pass over
+        half the budget, then (2) bisecting gaps whose neighbours disagree on the
+        track (a detected change), then (3) the largest remaining gaps. It counts
+        identify requests actually sent (see acr_requests()), so rate-limit retries
+        and hedged duplicates use it up too.
+        """
+        segment_len = 15 * 1000
+        step = 15 * 1000
+
+        windows = []  # (timestamp_ms, audio, start_ms), timeline order
+        silent = 0
+        for offset_ms, audio in sections:
+            for i in self._window_starts(len(audio), segment_len, step):
+                if audio[i:i + segment_len].dBFS < SILENCE_DBFS:
+                    silent += 1
+                    continue
+                windows.append((offset_ms + i, audio, i))
+        windows.sort(key=lambda w: w[0])
+        n = len(windows)
+        limit = min(max_calls, n)
+
+        probed = {}  # window index -> (acr_res, seg_bytes, latency_ms)
+        top_acrid = {}
+        spent = 0
+
+        def probe(idx):
+            nonlocal spent
+            timestamp_ms, audio, start_ms = windows[idx]
+            probed[idx] = self._identify_window(audio, start_ms, temp_dir, timestamp_ms, segment_len)
+            spent += acr_requests(probed[idx][0])
+            best, _ = self._pick_best_match(probed[idx][0], timestamp_ms)
+            top_acrid[idx] = best["acrid"] if best else None
+
+        # 1. Evenly spread
+        even = max(1, limit // 2) if limit else 0
+        for idx in sorted({int((k + 0.5) * n / even) for k in range(even)}):
+            if spent >= max_calls:
+                break
+            probe(idx)
+
+        # 2./3. Refine: change gaps first, then the largest plain gaps (edges count as plain gaps)
+        while len(probed) < limit and spent < max_calls:
+            marks = [-1] + sorted(probed) + [n]
+            gaps = []
+            for a, b in zip(marks, marks[1:]):
+                if b - a > 1:
+                    is_change = 0 <= a and b < n and top_acrid[a] != top_acrid[b]
+                    gaps.append((is_change, b - a, a, b))
+            if not gaps:
+                break
+            _, _, a, b = max(gaps)
+            probe((a + b) // 2)
+
+        # Replay in timeline order so winner selection/continuity matches the full scan
+        candidates = []
+        last_winner_title = None
+        for idx in sorted(probed):
+            acr_res, seg_bytes, latency_ms = probed[idx]
+            status_code, best_match = self._record_window(acr_res, windows[idx][0], results, last_winner_title, seg_bytes, latency_ms)
+            last_winner_title = self._next_winner_title(status_code, best_match, last_winner_title)
+            if best_match:
+                candidates.append(best_match)
+
+        results["coverage"] = {
+            "budget": max_calls,
+            "acr_calls": spent,
+            "windows_total": n + silent,
+            "windows_silent": silent,
+            "windows_probed": len(probed),
+            "coverage": round(len(probed) / n, 3) if n else 1.0,
+            "budget_exhausted": spent >= max_calls and len(probed) < n,
+        }
+        results["debug_log"].append(
+            f"🎯 Budget: {spent}/{max_calls} ACR calls, {len(probed)}/{n} non-silent windows probed "
+            f"({silent} silent skipped, coverage {results['coverage']['coverage']:.0%})")
+        return candidates
+
+    def _scan_chapters(self, sections, chapters, temp_dir, results, windows_per_chapter=2):
+        """Place 1-2 identification windows inside each chapter instead of scanning every 15s.
+
+        sections: [(offset_ms, AudioSegment), ...]. Windows sit evenly inside the
+        chapter (away from the crossfades at its edges); winners are timestamped at
+        the chapter start.
+        """
+        segment_len = 15 * 1000
+        candidates = []
+        last_winner_title = None
+        calls = 0
+
+        for chapter in chapters:
+            ch_start = int(chapter["start_time"] * 1000)
+            ch_end = int((chapter.get("end_time") or chapter["start_time"]) * 1000)
+            room = max(ch_end - ch_start - segment_len, 0)
+            positions = sorted({ch_start + room * k // (windows_per_chapter + 1) for k in range(1, windows_per_chapter + 1)})
+
+            for pos in positions:
+                # Section containing this window (partial downloads may not cover every chapter)
+                owner = [(offset_ms, audio) for offset_ms, audio in sections if offset_ms <= pos < offset_ms + len(audio)]
+                if not owner:
+                    continue
+                offset_ms, audio = owner[-1]
+                start_ms = min(pos - offset_ms, max(len(audio) - segment_len, 0))
+                status_code, best_match = self._recognize_window(
+                    audio, start_ms, temp_dir, results, offset_ms=offset_ms,
+                    last_winner_title=last_winner_title, segment_len=segment_len)
+                calls += 1
+                results["acr_raw"][-1]["chapter"] = {"start_ms": ch_start, "title": chapter.get("title")}
+                last_winner_title = self._next_winner_title(status_code, best_match, last_winner_title)
+                if best_match:
+                    candidates.append(best_match.copy(timestamp_ms=ch_start, chapter=chapter.get("title")))
+
+        results["debug_log"].append(f"📖 Chapters: {len(chapters)} chapters -> {calls} ACR calls")
+        return candidates
+
+    def _next_winner_title(self, status_code, best_match, last_winner_title):
+        """Continuity state carried to the next window (failed requests keep the previous winner)"""
+        if status_code != 0:
+            return last_winner_title
+        return best_match["title"] if best_match else None
+
+    def _download_savings(self, info, download_bytes, download_seconds):
+        """Compare the fingerprint-grade download against what "full" mode would have fetched.
+
+        With download ranges the baseline covers the same sections, not the whole
+        stream. est_seconds_saved is download time only: the skipped mp3 transcode
+        is not measured, so the real saving is at least that much.
+        """
+        duration = info.get('duration')
+        audio_formats = [f for f in info.get('formats') or [] if f.get('vcodec') == 'none']
+        baseline_bytes = max([_estimate_format_bytes(f, duration) for f in audio_formats] or [0])
+        baseline_seconds = duration
+        spans = [(dl.get('section_start') or 0, dl['section_end']) for dl in info.get('requested_downloads') or []
+                 if dl.get('section_end') is not None]
+        if duration and spans:
+            baseline_seconds = min(sum(max(min(end, duration) - start, 0) for start, end in spans), duration)
+            baseline_bytes = int(baseline_bytes * baseline_seconds / duration)
+        bytes_saved = max(baseline_bytes - download_bytes, 0)
+        seconds_saved = 0.0
+        if download_bytes and download_seconds > 0:
+            seconds_saved = bytes_saved / (download_bytes / download_seconds)
+        return {
+            "baseline_bytes": baseline_bytes,
+            "baseline_seconds": baseline_seconds,
+            "bytes_saved": bytes_saved,
+            "est_seconds_saved": round(seconds_saved, 2),
+            "transcode_skipped": True,
+        }
+
+    def _build_ydl_opts(self, download_mode="full", download_profile=None, time_ranges=None,
+                        sample_plan=None, proxy=None, cookies_path=None):
+        """yt-dlp options for one job (raises ValueError on a bad mode/profile)"""
+        import yt_dlp
+        if download_mode not in DOWNLOAD_FORMATS:
+            raise ValueError(f"Unknown download mode: {download_mode}")
+
         ydl_opts = {
-            'format': 'bestaudio/best',
+            'format': DOWNLOAD_FORMATS[download_mode],
             'outtmpl': '%(id)s.%(ext)s',
-            'postprocessors': [{'key': 'FFmpegExtractAudio','preferredcodec': 'mp3'}],
             'quiet': True,
             'no_warnings': True,
             'socket_timeout': 15,  # Add timeout
             'retries': 3,          # Add retries
         }
-        
+        if download_mode == "full":
+            ydl_opts['postprocessors'] = [{'key': 'FFmpegExtractAudio','preferredcodec': 'mp3'}]
+
+        ydl_opts.update(download_profile_opts(download_profile))
+
+        # Partial downloads: let yt-dlp fetch only the requested sections
+        if time_ranges:
+            ydl_opts['download_ranges'] = yt_dlp.utils.download_range_func(None, [tuple(r) for r in time_ranges])
+        elif sample_plan:
+            ydl_opts['download_ranges'] = _sample_plan_ranges(sample_plan)
+        if 'download_ranges' in ydl_opts:
+            ydl_opts['outtmpl'] = '%(id)s.%(section_start)s.%(ext)s'
+
         if proxy:
             ydl_opts['proxy'] = proxy
 
         if cookies_path and os.path.exists(cookies_path):
             ydl_opts['cookiefile'] = cookies_path
 
-        results = {
+        # Add robustness options
+        ydl_opts['source_address'] = '0.0.0.0' # Force IPv4
+        ydl_opts['nocheckcertificate'] = True  # Ignore SSL errors
+        return ydl_opts
+
+    def probe_video(self, video_url, cookies_path=None, proxy=None):
+        """Fast metadata probe (no download): duration, live status and audio formats"""
+        import yt_dlp
+        ydl_opts = self._build_ydl_opts(proxy=proxy, cookies_path=cookies_path)
+        ydl_opts.pop('postprocessors', None)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with yt_dlp.YoutubeDL(self._isolate_cookies(ydl_opts, temp_dir)) as ydl:
+                info = ydl.extract_info(video_url, download=False)
+        duration = info.get('duration')
+        return {
+            "id": info.get('id'),
+            "title": info.get('title'),
+            "duration": duration,
+            "is_live": bool(info.get('is_live')),
+            "live_status": info.get('live_status'),
+            "has_chapters": bool(info.get('chapters') or parse_description_chapters(info.get('description'), duration)),
+            "audio_formats": [{
+                "format_id": f.get('format_id'),
+                "ext": f.get('ext'),
+                "acodec": f.get('acodec'),
+                "abr": f.get('abr'),
+                "bytes": _estimate_format_bytes(f, duration),
+            } for f in info.get('formats') or [] if f.get('vcodec') == 'none'],
+        }
+
+    def _new_results(self):
+        return {
             "segments_processed": 0,
             "tracks_found": [],
             "acr_raw": [],
             "download_info": {},
-            "debug_log": []
+            "upload": {"profile": self.upload_profile, "bytes": 0, "latency_ms": 0.0},
+            "debug_log": JobLog()
+        }
+
+    def _cache_variant(self, download_mode, time_ranges=None, sample_plan=None):
+        """What was downloaded, besides the video id (audio cache key component)"""
+        return json.dumps({"mode": download_mode, "format": DOWNLOAD_FORMATS[download_mode],
+                           "ranges": [list(r) for r in time_ranges or []], "sample": sample_plan or None}, sort_keys=True)
+
+    def _isolate_cookies(self, ydl_opts, temp_dir):
+        """Give the job its own copy of the cookie file.
+
+        yt-dlp writes the cookie jar back to `cookiefile` when it closes, so
+        concurrent jobs sharing one file would clobber each other's session.
+        """
+        if ydl_opts.get('cookiefile'):
+            job_cookies = os.path.join(temp_dir, "cookies.txt")
+            shutil.copyfile(ydl_opts['cookiefile'], job_cookies)
+            ydl_opts = dict(ydl_opts, cookiefile=job_cookies)
+        return ydl_opts
+
+    def _download_attempts(self, ydl_opts):
+        """Per-job download strategies, tried in order: [(name, yt-dlp options), ...].
+
+        A stale system proxy (e.g. "Turned off VPN" case) is bypassed with yt-dlp's
+        `proxy: ""` (direct connection, environment proxies ignored) instead of
+        touching os.environ, which would change proxy behaviour for every other job.
+        """
+        attempts = [("configured" if ydl_opts.get('proxy') else "system proxy", ydl_opts)]
+        if ydl_opts.get('proxy') != "":
+            attempts.append(("direct (no proxy)", dict(ydl_opts, proxy="")))
+        return attempts
+
+    def _download(self, video_url, ydl_opts, temp_dir, results, download_mode="full", cache_variant=None):
+        """Download stage. Returns [(section_offset_ms, filepath), ...] and fills download_info.
+
+        With a `cache_variant` (format/sections description) the shared audio cache is
+        consulted first, and fresh downloads are stored in it.
+        """
+        import yt_dlp
+        cache = get_audio_cache() if cache_variant is not None else None
+        cache_key = cache.key(video_url, cache_variant) if cache else None
+        hit = cache.get(cache_key, temp_dir) if cache else None
+        if hit:
+            sections, meta = hit
+            results["download_info"] = dict(meta["info"], cache="hit", download_seconds=0)
+            results["debug_log"].append(f"💾 Audio cache hit ({cache_key}), download skipped")
+            return sections
+
+        ydl_opts = self._isolate_cookies(dict(ydl_opts, paths={'home': temp_dir}), temp_dir)
+
+        def run_download(options):
+            """Returns (info, [(section_offset_ms, filepath), ...])"""
+            with yt_dlp.YoutubeDL(options) as ydl:
+                info = ydl.extract_info(video_url, download=True)
+                sections = []
+                for dl in info.get('requested_downloads') or []:
+                    if dl.get('filepath'):
+                        sections.append((int((dl.get('section_start') or 0) * 1000), dl['filepath']))
+                if not sections:
+                    filename = ydl.prepare_filename(info)
+                    if download_mode == "full":
+                        filename = filename.rsplit('.', 1)[0] + '.mp3'
+                    sections.append((0, filename))
+                sections.sort()
+                return info, sections
+
+        download_start = time.time()
+        attempts = self._download_attempts(ydl_opts)
+        for n, (strategy, options) in enumerate(attempts):
+            try:
+                info, sections = run_download(options)
+                break
+            except Exception as e:
+                if n + 1 == len(attempts):
+                    raise # Every strategy failed: report the last error
+                print(f"Download failed ({strategy}): {e}. Retrying with strategy: {attempts[n + 1][0]}")
+                results["debug_log"].append(f"⚠️ Download failed ({strategy}). Retrying: {attempts[n + 1][0]}...",
+                                            "warning")
+
+        download_seconds = time.time() - download_start
+        sections = [(offset_ms, os.path.join(temp_dir, path)) for offset_ms, path in sections]
+        filepath = sections[0][1]
+        file_size = sum(os.path.getsize(path) for _, path in sections if os.path.exists(path))
+        results["download_info"] = {
+            "title": info.get('title'),
+            "duration": info.get('duration'),
+            "file_size": file_size,
+            "mode": download_mode,
+            "format_id": info.get('format_id'),
+            "ext": os.path.splitext(filepath)[1].lstrip('.'),
+            "download_bytes": file_size,
+            "download_seconds": round(download_seconds, 2),
+            "throughput_kbps": download_throughput(file_size, download_seconds),
+            "concurrent_fragments": ydl_opts.get('concurrent_fragment_downloads', 1),
+            "external_downloader": (ydl_opts.get('external_downloader') or {}).get('default'),
+            "rate_limit": ydl_opts.get('ratelimit'),
+            "strategy": strategy,
         }
+        chapters = info.get('chapters') or parse_description_chapters(info.get('description'), info.get('duration'))
+        if chapters:
+            results["download_info"]["chapters"] = [
+                {"start_time": c.get("start_time", 0), "end_time": c.get("end_time"), "title": c.get("title")} for c in chapters
+            ]
+        if 'download_ranges' in ydl_opts:
+            results["download_info"]["sections"] = [offset_ms // 1000 for offset_ms, _ in sections]
+            results["debug_log"].append(f"📥 Partial download: {len(sections)} section(s) starting at {results['download_info']['sections']} s")
+        if download_mode == "fingerprint":
+            results["download_info"].update(self._download_savings(info, file_size, download_seconds))
+        if cache:
+            cache.put(cache_key, sections, results["download_info"])
+            results["download_info"]["cache"] = "miss"
+        return sections
+
+    def _aggregate_candidates(self, all_candidates):
+        """Merge per-window winners into a list of unique tracks (appearance order)"""
+        # Aggregation for Medley:
+        # We want to list ALL unique songs found, not just the most frequent.
+        # 1. Group by ACRID
+        track_map = {}
+        for cand in all_candidates:
+            acrid = cand["acrid"]
+
+            # 1.1 De-duplication Logic (Crucial for Mashups)
+            # Many mashups return slightly different titles for the same song (e.g., "Peaches" vs "Peaches (Remix)")
+            # For now, let's trust ACRID here and do the title-based dedup pass below.
+
+            if acrid not in track_map:
+                track_map[acrid] = cand.copy()
+            else:
+                # Keep the instance with highest score
+                if cand["score"] > track_map[acrid]["score"]:
+                    track_map[acrid] = cand.copy()
+                # User usually wants to know when the song *starts*.
+                if cand["timestamp_ms"] < track_map[acrid]["timestamp_ms"]:
+                     track_map[acrid]["timestamp_ms"] = cand["timestamp_ms"]
+
+        # 2. Convert to list and sort by timestamp (appearance order)
+        sorted_tracks = sorted(track_map.values(), key=lambda x: x["timestamp_ms"])
+        if not self.filter_params["title_dedup"]:
+            return sorted_tracks
+
+        # 2.5 Title-based Deduplication (Post-processing)
+        # This fixes "Stay" vs "Stay - Shane Thompson" appearing as two results
+        unique_titles = {}
+        final_tracks = []
+
+        for track in sorted_tracks:
+            # Normalize title for dedup: "Peaches (Remix)" -> "peaches"
+            clean_title = re.sub(r"[\(\[].*?[\)\]]", "", track["title"]).strip().lower()
+            # Also remove artists from title if present "Stay - Justin Bieber" -> "Stay"
+            if " - " in clean_title:
+                clean_title = clean_title.split(" - ")[0].strip()
+
+            if clean_title not in unique_titles:
+                unique_titles[clean_title] = track
+                final_tracks.append(track)
+            else:
+                existing = unique_titles[clean_title]
+                # Merge logic:
+                # 1. Update max score
+                existing["score"] = max(existing["score"], track["score"])
+
+                # 2. Keep the cleaner title (shorter is usually better/official)
+                # e.g. "Stay" vs "Stay - Shane Thompson" -> Keep "Stay"
+                if len(track["title"]) < len(existing["title"]):
+                    existing["title"] = track["title"]
+                    existing["artists"] = track["artists"]
+
+        return final_tracks
+
+    def _reject_reason(self, title):
+        """Garbage Filtering Strategy (Enhanced): returns a reject reason, or None if the title looks clean"""
+        # 1. Explicit Blacklist
+        blacklist = self.filter_params["blacklist"]
+
+        if any(bad in title for bad in blacklist) or title.isdigit():
+            return "Blacklist/Mojibake/Derivative"
+
+        # 2. Mojibake Detection
+        suspicious_chars = self.filter_params["suspicious_chars"]
+        if any(char in title for char in suspicious_chars):
+            return "Suspicious"
+        return None
+
+    def _accept_track(self, track, netease_matches, results):
+        """Netease check + final result construction for a track that passed the title filters"""
+        artist_str = ", ".join([a["name"] for a in track["artists"]])
+        title = track["title"]
+        score = track["score"]
+        log_entry = f"Final: {title} ({score})"
+
+        # 3. Netease Verification (Relaxed)
+        # None = verification unavailable (service down / circuit open): don't hold it against the track
+        if netease_matches is None:
+            results["netease_unavailable"] = results.get("netease_unavailable", 0) + 1
+            log_entry += " -> ⚠️ PASSED (Netease unavailable, unverified)"
+            level = "warning"
+        elif score < self.filter_params["netease_min_score"] and not netease_matches:
+            log_entry += " -> ❌ REJECTED (No Netease)"
+            results["debug_log"].append(log_entry, "reject")
+            return
+        else:
+            log_entry += " -> ✅ PASSED"
+            level = "info"
+        results["debug_log"].append(log_entry, level)
+
+        # Format timestamp
+        seconds = track["timestamp_ms"] // 1000
+        time_str = f"{seconds//60:02d}:{seconds%60:02d}"
+
+        results["tracks_found"].append(TrackRecord(
+            title=title,
+            artist=artist_str,
+            score=score,
+            timestamp=time_str,
+            netease_matches=netease_matches or [],
+            verified=netease_matches is not None
+        ))
+
+    def _prepare_final(self, all_candidates, results):
+        """Aggregate and title-filter.
+
+        Returns [(track, reject_reason or None), ...] in appearance order.
+        After a quick-mode early exit the medley aggregation/dedup passes are skipped.
+        """
+        if results.get("early_exit"):
+            final_tracks = [c.copy() for c in all_candidates]
+        else:
+            final_tracks = self._aggregate_candidates(all_candidates)
+
+        upload = results["upload"]
+        if results["segments_processed"]:
+            upload["avg_bytes"] = upload["bytes"] // results["segments_processed"]
+            upload["avg_latency_ms"] = round(upload["latency_ms"] / results["segments_processed"], 1)
+        upload["latency_ms"] = round(upload["latency_ms"], 1)
+        if self.hedge:
+            # Extra identify requests spent on hedging (cumulative for this recognizer)
+            threshold = latency_window(self.acr_host).percentile(self.hedge["percentile"], self.hedge["min_samples"])
+            results["hedge"] = dict(self.hedge_stats, budget=self.hedge["budget"],
+                                    threshold_s=round(threshold, 3) if threshold is not None else None)
+
+        if results.get("early_exit"):
+            results["debug_log"].append(f"\n--- Quick Mode: {len(final_tracks)} Track (aggregation skipped) ---")
+        else:
+            results["debug_log"].append(f"\n--- Final Aggregation: {len(final_tracks)} Unique Tracks (Deduped) ---")
+        return [(track, self._reject_reason(track["title"])) for track in final_tracks]
+
+    def _finalize(self, all_candidates, results, offline=False):
+        """Aggregation, filtering and Netease verification -> results["tracks_found"]"""
+        for track, reason in self._prepare_final(all_candidates, results):
+            if reason:
+                results["debug_log"].append(f"Final: {track['title']} ({track['score']}) -> ❌ REJECTED ({reason})",
+                                            "reject")
+                continue
+            artist_str = ", ".join([a["name"] for a in track["artists"]])
+            self._accept_track(track, self._search_netease_memo(track["title"], artist_str, results, offline), results)
+        self._note_netease_status(results)
+
+    def _note_netease_status(self, results):
+        """Surface an unavailable Netease service (tracks passed unverified) in the result"""
+        if results.get("netease_unavailable"):
+            breaker = get_circuit_breaker(self.netease_api).snapshot()
+            results["netease_status"] = breaker
+            results["debug_log"].append(f"⚠️ Netease unavailable for {results['netease_unavailable']} track(s), "
+                                        f"kept unverified (circuit {breaker['state']})", "warning")
+
+    def _search_netease_memo(self, title, artist, results, offline=False):
+        """_search_netease through the job's lookup log (results["netease_raw"]), which
+        reprocess() reuses. Offline, an unseen title counts as "no Netease match";
+        online, lookups that found the service unavailable (None) are retried."""
+        memo = results.setdefault("netease_raw", {})
+        key = f"{title}\n{artist}"
+        if key not in memo or (memo[key] is None and not offline):
+            if offline:
+                return []
+            memo[key] = self._search_netease(title, artist)
+        return memo[key]
+
+    def _replay_windows(self, records, results):
+        """Winner selection over already identified windows ({"timestamp_ms", "response",
+        optional "chapter" / "seg_bytes" / "latency_ms"}), in timeline order"""
+        candidates = []
+        last_winner_title = None
+        for record in sorted(records, key=lambda r: r["timestamp_ms"]):
+            status_code, best_match = self._record_window(record["response"], record["timestamp_ms"], results,
+                                                          last_winner_title, record.get("seg_bytes", 0),
+                                                          record.get("latency_ms", 0.0))
+            last_winner_title = self._next_winner_title(status_code, best_match, last_winner_title)
+            if best_match and record.get("chapter"):
+                best_match = best_match.copy(timestamp_ms=record["chapter"]["start_ms"], chapter=record["chapter"]["title"])
+            if best_match:
+                candidates.append(best_match)
+        return candidates
+
+    def _worker_kwargs(self):
+        """Constructor arguments for an equivalent recognizer in a worker process"""
+        return {"acr_host": self.acr_host, "acr_key": self.acr_key, "acr_secret": self.acr_secret,
+                "netease_api": self.netease_api, "upload_profile": self.upload_profile,
+                "rate_limit_retries": self.rate_limit_retries, "filter_params": self.filter_params,
+                "hedge": self.hedge, "retain_raw": self.retain_raw}
+
+    def _scan_sharded(self, sections, temp_dir, results, shards):
+        """Full scan with each section split into time shards that worker processes
+        (or queue workers on other nodes) identify in parallel; see sharding.py.
+        Returns the same candidates as the sequential _scan_audio loop, which is
+        also what runs when the decoded audio fits in a single shard."""
+        from pydub import AudioSegment
+        from sharding import (DEFAULT_SHARD_SECONDS, ShardQueue, plan_shards, merge_shard_windows,
+                              run_shards_local, run_shards_queue)
+        segment_len = step = 15 * 1000
+        shard_ms = int(float(shards.get("shard_seconds") or DEFAULT_SHARD_SECONDS) * 1000)
+        queue = ShardQueue(shards["queue_dir"]) if shards.get("queue_dir") else None
+        if queue and shards.get("queue_key") != self.acr_key:
+            # Queue workers bill their own ACR project; other keys stay on local processes
+            results["debug_log"].append("🧩 Shard queue serves another ACR key, using local worker processes", "warning")
+            queue = None
+        # Decide from the decoded lengths: yt-dlp often has no duration (direct media URLs)
+        planned = []
+        for offset_ms, section_path in sections:
+            audio = AudioSegment.from_file(section_path)
+            planned.append((offset_ms, audio, plan_shards(self._window_starts(len(audio), segment_len, step),
+                                                          shard_ms, segment_len)))
+        if sum(len(specs) for _, _, specs in planned) <= 1:
+            candidates = []
+            for offset_ms, audio, _ in planned:
+                candidates.extend(self._scan_audio(audio, temp_dir, results, offset_ms=offset_ms))
+            return candidates
+
+        job_id = uuid.uuid4().hex[:12]
+        audio_dir = queue.audio_dir(job_id) if queue else os.path.join(temp_dir, "shards")
+        os.makedirs(audio_dir, exist_ok=True)
+
+        tasks = []
+        while planned:
+            offset_ms, audio, specs = planned.pop(0)
+            for spec in specs:
+                # Workers read plain WAV slices: no second decode of the download
+                shard_path = os.path.join(audio_dir, f"shard_{len(tasks)}.wav")
+                audio[spec["audio_start_ms"]:spec["audio_end_ms"]].export(shard_path, format="wav")
+                tasks.append(dict(spec, task_id=f"{job_id}_{len(tasks):04d}", job_id=job_id, index=len(tasks),
+                                  offset_ms=offset_ms, audio_path=shard_path, segment_len=segment_len,
+                                  acr_key=self.acr_key))
+            del audio
+
+        t0 = time.time()
+        try:
+            if queue:
+                shard_results = run_shards_queue(queue, tasks, self._worker_kwargs())
+            else:
+                shard_results = run_shards_local(tasks, self._worker_kwargs(), shards.get("workers"))
+        finally:
+            if queue:
+                queue.cleanup(job_id)
+        failed = [s["error"] for s in shard_results if "error" in s]
+        if failed:
+            raise RuntimeError("; ".join(failed))
+
+        results["sharding"] = {
+            "mode": "queue" if queue else "processes",
+            "shards": len(tasks),
+            "shard_seconds": shard_ms // 1000,
+            "seconds": round(time.time() - t0, 2),
+            "per_shard": [{"index": s["index"], "windows": len(s["windows"]), "seconds": s["seconds"],
+                           "worker": s["worker"]} for s in sorted(shard_results, key=lambda s: s["index"])],
+        }
+        results["debug_log"].append(f"🧩 Sharded scan: {len(tasks)} shard(s) of {shard_ms // 60000} min, "
+                                    f"{len({s['worker'] for s in shard_results})} worker(s), "
+                                    f"{results['sharding']['seconds']}s")
+        # Sections are replayed separately: the sequential scan restarts continuity per section
+        candidates = []
+        for _, windows in merge_shard_windows(shard_results):
+            candidates.extend(self._replay_windows(windows, results))
+        return candidates
+
+    def reprocess(self, acr_raw, netease_raw=None, offline=True):
+        """Re-run winner selection, aggregation, filtering and verification over stored
+        raw segment responses (results["acr_raw"]) with this recognizer's filter_params.
+
+        Makes zero ACR calls; Netease answers come from `netease_raw` (and, unless
+        `offline`, from the live API for titles not looked up before).
+        """
+        t0 = time.time()
+        results = self._new_results()
+        results["netease_raw"] = dict(netease_raw or {})
+        candidates = self._replay_windows(acr_raw, results)
+        self._finalize(candidates, results, offline=offline)
+        results["reprocess_ms"] = round((time.time() - t0) * 1000, 2)
+        return results
+
+    def process_video(self, video_url, cookies_path=None, proxy=None, download_mode="full",
+                      time_ranges=None, sample_plan=None, download_profile=None, max_acr_calls=None,
+                      quick=None, use_chapters=False, windows_per_chapter=2, shards=None):
+        """Main entry point: Download -> Slice -> Recognize -> Search
+
+        download_mode: "full" (bestaudio + MP3 transcode) or "fingerprint"
+        (smallest usable audio stream, decoded from its native container).
+        time_ranges: optional [(start_sec, end_sec), ...]; only these sections are downloaded.
+        sample_plan: optional {"every": sec, "length": sec}; download `length` seconds out of every `every`.
+        download_profile: optional DOWNLOAD_PROFILES name or dict (parallel fragments,
+        external downloader, per-job bandwidth cap); see download_profile_opts.
+        max_acr_calls: optional per-job identify budget; windows are then chosen by
+        priority (see _scan_budgeted) and results["coverage"] reports how much was scanned.
+        quick: optional {"agree": N, "min_score": S} single-song fast mode; stops once N
+        consecutive windows agree on one acrid (see _scan_audio). Ignored with max_acr_calls.
+        use_chapters: place `windows_per_chapter` windows per chapter (yt-dlp chapters, or a
+        timestamped tracklist in the description) instead of scanning every 15s; falls
+        back to the normal scan when the video has no chapters.
+        shards: optional {"workers": N, "shard_seconds": S, "queue_dir": path, "queue_key": ACR
+        access key the queue workers use (the queue is only used for that key)}; videos longer
+        than one shard are scanned in parallel time shards (see _scan_sharded). Applies
+        to the plain full scan only (not chapters, budgets or quick mode); audio that fits in
+        one shard is scanned sequentially.
+        Timestamps are always reported in the original video timeline.
+        """
+        from pydub import AudioSegment
+        if isinstance(self.upload_profile, str) and self.upload_profile not in UPLOAD_PROFILES:
+            return {"error": f"Unknown upload profile: {self.upload_profile}"}
+        try:
+            ydl_opts = self._build_ydl_opts(download_mode, download_profile, time_ranges, sample_plan, proxy, cookies_path)
+        except ValueError as e:
+            return {"error": str(e)}
+
+        results = self._new_results()
 
         with tempfile.TemporaryDirectory() as temp_dir:
-            ydl_opts['paths'] = {'home': temp_dir}
-            
             # 1. Download
-            # Strategy: First try with provided options. If it fails and looks like a network error,
-            # and no explicit proxy was given, try stripping environment proxies (fallback for "Turned off VPN" case).
-            
-            def run_download(options):
-                with yt_dlp.YoutubeDL(options) as ydl:
-                    info = ydl.extract_info(video_url, download=True)
-                    filename = ydl.prepare_filename(info).rsplit('.', 1)[0] + '.mp3'
-                    return info, filename
-
             try:
-                # Add robustness options
-                ydl_opts['source_address'] = '0.0.0.0' # Force IPv4
-                ydl_opts['nocheckcertificate'] = True  # Ignore SSL errors
-                
-                try:
-                    info, filename_base = run_download(ydl_opts)
-                except Exception as first_error:
-                    # If failed, and we didn't explicitly set a proxy in ydl_opts (meaning we used system env),
-                    # let's try to "clear" the proxy and retry.
-                    # CRITICAL FIX: We must temporarily unset os.environ variables because yt-dlp/urllib might prioritize them
-                    print("Download failed. Detect potential stale proxy in env. Retrying with CLEARED env vars...")
-                    results["debug_log"].append("⚠️ Network failed. Attempting to clear system proxy env vars and retry...")
-                    
-                    # Backup current env
-                    backup_env = {}
-                    proxy_vars = ['HTTP_PROXY', 'HTTPS_PROXY', 'ALL_PROXY', 'http_proxy', 'https_proxy', 'all_proxy']
-                    for var in proxy_vars:
-                        if var in os.environ:
-                            backup_env[var] = os.environ.pop(var)
-                    
-                    try:
-                        # Retry with empty proxy option AND cleared environment
-                        retry_opts = ydl_opts.copy()
-                        retry_opts['proxy'] = "" 
-                        info, filename_base = run_download(retry_opts)
-                    except Exception as second_error:
-                        raise second_error # If it fails again, raise the new error
-                    finally:
-                        # Restore env (good citizenship)
-                        for var, val in backup_env.items():
-                            os.environ[var] = val
-
-                filepath = os.path.join(temp_dir, filename_base)
-                results["download_info"] = {
-                    "title": info.get('title'),
-                    "duration": info.get('duration'),
-                    "file_size": os.path.getsize(filepath) if os.path.exists(filepath) else 0
-                }
+                sections = self._download(video_url, ydl_opts, temp_dir, results, download_mode,
+                                          cache_variant=self._cache_variant(download_mode, time_ranges, sample_plan))
             except Exception as e:
                 return {"error": f"Video download failed: {str(e)} \n(提示: 请检查网络或在高级配置中填入有效代理)"}
 
             # 2. Slice and Recognize
             try:
-                audio = AudioSegment.from_file(filepath)
-                total_len = len(audio) # milliseconds
-                
-                # Strategy: For medleys, we need to scan the whole file.
-                # To save time/quota, we use a stride.
-                # - Segment length: 15s
-                # - Stride: 
-                #   - Continuous scanning (step = 15s) to ensure we don't miss short songs in a medley.
-                
-                segment_len = 15 * 1000
-                step = 15 * 1000  # No gaps, continuous coverage
-
+                # Strategy: For medleys, we need to scan the whole file (or every downloaded section).
+                # Timestamps are reported in the original video timeline via each section's offset.
                 all_candidates = []
-                
-                last_winner_title = None
-
-                # Scan entire file with step
-                for i in range(0, total_len, step):
-                    # Stop if we are too close to end
-                    if i + segment_len > total_len:
-                        break
-                        
-                    segment = audio[i:i+segment_len]
-                    seg_path = os.path.join(temp_dir, f"seg_{i}.mp3")
-                    segment.export(seg_path, format="mp3")
-                    
-                    acr_res = self._recognize_segment(seg_path)
-                    results["segments_processed"] += 1
-                    
-                    time_str = f"{i//1000//60:02d}:{i//1000%60:02d}"
-                    log_entry = f"[{time_str}] Status: {acr_res.get('status', {}).get('code')}"
-                    
-                    if acr_res.get("status", {}).get("code") == 0:
-                        matches = acr_res.get("metadata", {}).get("music", [])
-                        
-                        segment_logs = []
-                        valid_candidates = []
-                        
-                        for music in matches:
-                            title = music.get("title")
-                            score = music.get("score", 0)
-                            
-                            # Filter 1: Base Score
-                            if score < 30:
-                                continue
-                            
-                            valid_candidates.append({
-                                "title": title,
-                                "artists": music.get("artists", []),
-                                "acrid": music.get("acrid"),
-                                "score": score,
-                                "timestamp_ms": i,
-                                "raw_match": music
-                            })
-                        
-                        # Selection Logic: Pick ONE best match for this slice
-                        if valid_candidates:
-                            # Sort key: 
-                            # 1. Score (Highest)
-                            # 2. Continuity (Matches previous winner)
-                            # 3. Title Length (Shortest) - heuristic for "Original" vs "Remix"
-                            valid_candidates.sort(key=lambda x: (
-                                x["score"], 
-                                1 if x["title"] == last_winner_title else 0, 
-                                -len(x["title"])
-                            ), reverse=True)
-                            
-                            best_match = valid_candidates[0]
-                            last_winner_title = best_match["title"]
-                            
-                            # Log the winner
-                            segment_logs.append(f"✅ {best_match['title']}({best_match['score']})")
-                            
-                            # Log skipped high-score candidates (for debugging/user visibility)
-                            if len(valid_candidates) > 1:
-                                skipped_titles = [c['title'] for c in valid_candidates[1:]]
-                                segment_logs.append(f"[Skipped: {'; '.join(skipped_titles)}]")
-
-                            # Only add the winner to candidates
-                            all_candidates.append(best_match)
-                        else:
-                            # No valid candidates (all low score)
-                            last_winner_title = None 
-
-                        log_entry += " | " + "; ".join(segment_logs)
-                    else:
-                         log_entry += f" | Msg: {acr_res.get('status', {}).get('msg')}"
-                    
-                    results["debug_log"].append(log_entry)
-
-                # Aggregation for Medley:
-                # We want to list ALL unique songs found, not just the most frequent.
-                # 1. Group by ACRID
-                track_map = {}
-                for cand in all_candidates:
-                    acrid = cand["acrid"]
-                    
-                    # 1.1 De-duplication Logic (Crucial for Mashups)
-                    # Many mashups return slightly different titles for the same song (e.g., "Peaches" vs "Peaches (Remix)")
-                    # We should normalize titles to avoid duplicates in the UI.
-                    
-                    # Simple normalization: Lowercase, remove anything in brackets/parentheses
-                    # This helps merge "Stay" and "Stay (Remix)"
-                    import re
-                    clean_title = re.sub(r"[\(\[].*?[\)\]]", "", cand["title"]).strip().lower()
-                    
-                    # Also use the cleaned title as a secondary key if ACRID is different but song is likely same
-                    # But be careful not to merge different songs with same name.
-                    # For now, let's trust ACRID but add a title-based dedup pass later.
-                    
-                    if acrid not in track_map:
-                        track_map[acrid] = cand
-                    else:
-                        # Keep the instance with highest score
-                        if cand["score"] > track_map[acrid]["score"]:
-                            track_map[acrid] = cand
-                        # Also update timestamp if this instance appeared earlier? 
-                        # No, we want the *first* appearance usually, or the best match appearance.
-                        # Let's keep the timestamp of the highest score match for now, 
-                        # OR keep the earliest timestamp?
-                        # User usually wants to know when the song *starts*.
-                        if cand["timestamp_ms"] < track_map[acrid]["timestamp_ms"]:
-                             track_map[acrid]["timestamp_ms"] = cand["timestamp_ms"]
-
-                # 2. Convert to list and sort by timestamp (appearance order)
-                sorted_tracks = sorted(track_map.values(), key=lambda x: x["timestamp_ms"])
-                
-                # 2.5 Title-based Deduplication (Post-processing)
-                # This fixes "Stay" vs "Stay - Shane Thompson" appearing as two results
-                unique_titles = {}
-                final_tracks = []
-                
-                # Pre-processing: We want to prefer the version with the SHORTEST title (usually original)
-                # or the one with the HIGHEST score.
-                # Let's group by simplified title first.
-                
-                for track in sorted_tracks:
-                    # Normalize title for dedup: "Peaches (Remix)" -> "peaches"
-                    clean_title = re.sub(r"[\(\[].*?[\)\]]", "", track["title"]).strip().lower()
-                    # Also remove artists from title if present "Stay - Justin Bieber" -> "Stay"
-                    if " - " in clean_title:
-                        clean_title = clean_title.split(" - ")[0].strip()
-                    
-                    if clean_title not in unique_titles:
-                        unique_titles[clean_title] = track
-                        final_tracks.append(track)
-                    else:
-                        existing = unique_titles[clean_title]
-                        # Merge logic:
-                        # 1. Update max score
-                        existing["score"] = max(existing["score"], track["score"])
-                        
-                        # 2. Keep the cleaner title (shorter is usually better/official)
-                        # e.g. "Stay" vs "Stay - Shane Thompson" -> Keep "Stay"
-                        if len(track["title"]) < len(existing["title"]):
-                            existing["title"] = track["title"]
-                            existing["artists"] = track["artists"]
-                        
-                        # 3. If scores are equal, but new one has "Justin Bieber" in artist, prefer it?
-                        # (Optional enhancement)
-                
-                results["debug_log"].append(f"\n--- Final Aggregation: {len(final_tracks)} Unique Tracks (Deduped) ---")
-
-                # 3. Final Result Construction
-                for track in final_tracks:  
-                    artist_str = ", ".join([a["name"] for a in track["artists"]])
-                    title = track["title"]
-                    score = track["score"]
-                    
-                    log_entry = f"Final: {title} ({score})"
-
-                    # --- Garbage Filtering Strategy (Enhanced) ---
-                    
-                    # 1. Explicit Blacklist (Expanded based on feedback)
-                    blacklist = ["E.V.C", "Audio", "Unknown", "Track", "Test", "ä", "å", "è", "é", "ç", "ð", "Mashup", "Remix", "Bootleg", "Mix", "+", "Ludacris", "lo-lo-lo", "Pop Danthology"]
-                    # Added "Pop Danthology" to blacklist
-                    
-                    if any(bad in title for bad in blacklist) or title.isdigit():
-                        log_entry += " -> ❌ REJECTED (Blacklist/Mojibake/Derivative)"
-                        results["debug_log"].append(log_entry)
-                        continue
-
-                    # 2. Mojibake Detection
-                    suspicious_chars = ["Ã", "â", "ä", "å", "ç", "è", "é", "ð", "ñ", "ò", "ó", "ô", "õ", "ö"]
-                    is_suspicious = any(char in title for char in suspicious_chars)
-                    
-                    if is_suspicious:
-                         log_entry += " -> ❌ REJECTED (Suspicious)"
-                         results["debug_log"].append(log_entry)
-                         continue
-                        
-                    # 3. Netease Verification (Relaxed)
-                    netease_matches = self._search_netease(title, artist_str)
-                    
-                    if score < 40 and not netease_matches:
-                        log_entry += " -> ❌ REJECTED (No Netease)"
-                        results["debug_log"].append(log_entry)
-                        continue
-
-                    log_entry += " -> ✅ PASSED"
-                    results["debug_log"].append(log_entry)
-
-                    # Format timestamp
-                    seconds = track["timestamp_ms"] // 1000
-                    time_str = f"{seconds//60:02d}:{seconds%60:02d}"
-                    
-                    results["tracks_found"].append({
-                        "title": title,
-                        "artist": artist_str,
-                        "score": score,
-                        "timestamp": time_str,
-                        "netease_matches": netease_matches,
-                        "external_links": self._generate_external_links(title, artist_str)
-                    })
+                chapters = results["download_info"].get("chapters") if use_chapters else None
+                if use_chapters and not chapters:
+                    results["debug_log"].append("📖 No chapters found, falling back to a full scan")
+                if chapters:
+                    loaded = [(offset_ms, AudioSegment.from_file(path)) for offset_ms, path in sections]
+                    all_candidates = self._scan_chapters(loaded, chapters, temp_dir, results, int(windows_per_chapter))
+                elif max_acr_calls:
+                    loaded = [(offset_ms, AudioSegment.from_file(path)) for offset_ms, path in sections]
+                    all_candidates = self._scan_budgeted(loaded, temp_dir, results, int(max_acr_calls))
+                elif shards and not quick:
+                    all_candidates = self._scan_sharded(sections, temp_dir, results, shards)
+                else:
+                    for offset_ms, section_path in sections:
+                        audio = AudioSegment.from_file(section_path)
+                        candidates = self._scan_audio(audio, temp_dir, results, offset_ms=offset_ms, quick=quick)
+                        if results.get("early_exit"):
+                            all_candidates = candidates
+                            break
+                        all_candidates.extend(candidates)
+
+                # 3. Aggregate, filter and verify
+                self._finalize(all_candidates, results)
 
             except Exception as e:
                 return {"error": f"Audio processing failed: {str(e)}", "partial_results": results}
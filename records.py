@@ -0,0 +1,168 @@
+"""Compact in-memory records for job results.
+
+A job used to keep a dict per window candidate (with the full ACR `raw_match`),
+the full ACR response of every window and an unbounded list of log strings, all
+held in JOBS for as long as the process lives. These slot-based records keep
+only the fields the pipeline reads; raw payloads are kept only on request
+(MusicRecognizer(retain_raw=True)).
+
+Candidate and TrackRecord still support `rec["title"]` / `rec.get("title")`, so
+code written against the old dicts keeps working; use to_jsonable() before
+json.dumps / jsonify.
+"""
+import os
+import time
+from collections import deque
+
+# Debug log lines kept per job; older lines are dropped (and counted)
+DEBUG_LOG_MAX_LINES = int(os.environ.get("DEBUG_LOG_MAX_LINES", 500))
+# JobLog levels: "info", "warning" (degraded: failed ACR window, retry, unverified
+# track) and "reject" (a candidate the filters threw out)
+LOG_LEVELS = ("info", "warning", "reject")
+
+class _SlotRecord:
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__ and getattr(self, key, None) is not None
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+    def copy(self, **changes):
+        clone = self.__class__.__new__(self.__class__)
+        for name in self.__slots__:
+            setattr(clone, name, changes.get(name, getattr(self, name)))
+        return clone
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__ if getattr(self, name) is not None}
+
+    def __eq__(self, other):
+        return isinstance(other, _SlotRecord) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.to_dict()!r})"
+
+class Candidate(_SlotRecord):
+    """One window's winning ACR match"""
+    __slots__ = ("title", "artists", "acrid", "score", "timestamp_ms", "chapter", "raw_match")
+
+    def __init__(self, title, artists, acrid, score, timestamp_ms, chapter=None, raw_match=None):
+        self.title = title
+        self.artists = artists
+        self.acrid = acrid
+        self.score = score
+        self.timestamp_ms = timestamp_ms
+        self.chapter = chapter
+        self.raw_match = raw_match
+
+class TrackRecord(_SlotRecord):
+    """One entry of results["tracks_found"]. External search links are derived on
+    access instead of being stored per track."""
+    __slots__ = ("title", "artist", "score", "timestamp", "netease_matches", "verified")
+
+    def __init__(self, title, artist, score, timestamp, netease_matches, verified=True):
+        self.title = title
+        self.artist = artist
+        self.score = score
+        self.timestamp = timestamp
+        self.netease_matches = netease_matches
+        self.verified = verified
+
+    @property
+    def external_links(self):
+        from recognizer import external_links
+        return external_links(self.title, self.artist)
+
+    def __getitem__(self, key):
+        if key == "external_links":
+            return self.external_links
+        return super().__getitem__(key)
+
+    def to_dict(self):
+        return dict(super().to_dict(), verified=self.verified, external_links=self.external_links)
+
+class JobLog:
+    """Ring-buffered structured job log.
+
+    Entries are (elapsed_ms, level, message); past `maxlen` the oldest ones are
+    dropped and counted. Iterating yields the message strings (with a note about
+    dropped lines first), so `"\\n".join(log)` renders like the old list did;
+    entries() is the structured form /api/result serves.
+    """
+    __slots__ = ("_entries", "dropped", "started")
+
+    def __init__(self, maxlen=None):
+        self._entries = deque(maxlen=maxlen or DEBUG_LOG_MAX_LINES)
+        self.dropped = 0
+        self.started = time.time()
+
+    def append(self, message, level="info"):
+        if len(self._entries) == self._entries.maxlen:
+            self.dropped += 1
+        self._entries.append((int((time.time() - self.started) * 1000), level, message))
+
+    def __iter__(self):
+        if self.dropped:
+            yield f"... {self.dropped} earlier log lines dropped ..."
+        for _, _, message in self._entries:
+            yield message
+
+    def __len__(self):
+        return len(self._entries) + (1 if self.dropped else 0)
+
+    def __getitem__(self, index):
+        return list(self)[index]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def entries(self):
+        return [{"t_ms": t_ms, "level": level, "msg": message} for t_ms, level, message in self._entries]
+
+def acr_requests(acr_res):
+    """Identify requests one response cost: its "acr_requests" count, else one plus
+    its rate-limit retries (responses from before the count, the async scanner)"""
+    return acr_res.get("acr_requests", 1 + acr_res.get("rate_limit_retries", 0))
+
+def compact_acr_response(acr_res):
+    """What reprocess() needs from an identify response, in the same shape:
+    status, retry / request counts and per-match title / artist names / acrid / score"""
+    status = acr_res.get("status", {})
+    compact = {"status": {"code": status.get("code"), "msg": status.get("msg")}}
+    if acr_res.get("rate_limit_retries"):
+        compact["rate_limit_retries"] = acr_res["rate_limit_retries"]
+    if acr_res.get("acr_requests", 1) != 1:
+        compact["acr_requests"] = acr_res["acr_requests"]
+    music = acr_res.get("metadata", {}).get("music")
+    if music:
+        compact["metadata"] = {"music": [{
+            "title": m.get("title"),
+            "artists": [{"name": a.get("name")} for a in m.get("artists", [])],
+            "acrid": m.get("acrid"),
+            "score": m.get("score", 0),
+        } for m in music]}
+    return compact
+
+def to_jsonable(obj):
+    """Records / logs / deques -> plain JSON types (recursively)"""
+    if isinstance(obj, _SlotRecord):
+        return to_jsonable(obj.to_dict())
+    if isinstance(obj, JobLog):
+        return list(obj)
+    if isinstance(obj, dict):
+        return {k: to_jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple, deque)):
+        return [to_jsonable(v) for v in obj]
+    return obj
@@ -0,0 +1,66 @@
+"""Re-run filtering / aggregation of a finished job with new parameters.
+
+Usage: python reprocess.py <job_id | job.json> [--min-score N] [--netease-min-score N]
+                           [--blacklist "a,b,c"] [--no-title-dedup] [--online]
+
+Job records are the JSON files the webapp writes to JOB_STORE_DIR on completion.
+No audio is downloaded and ACRCloud is never called; Netease answers come from the
+stored lookups unless --online is given (then NETEASE_API_BASE is used for new titles).
+"""
+import os
+import sys
+import json
+import tempfile
+from recognizer import MusicRecognizer
+from records import to_jsonable
+
+def load_record(ref):
+    path = ref if ref.endswith(".json") else os.path.join(
+        os.environ.get("JOB_STORE_DIR") or os.path.join(tempfile.gettempdir(), "video_music_jobs"), f"{ref}.json")
+    with open(path) as f:
+        return json.load(f)
+
+def pop_option(args, name):
+    if name not in args:
+        return None
+    i = args.index(name)
+    value = args[i + 1]
+    del args[i:i + 2]
+    return value
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        print(__doc__)
+        return
+    filter_params = {}
+    for option, key in (("--min-score", "min_score"), ("--netease-min-score", "netease_min_score")):
+        value = pop_option(args, option)
+        if value is not None:
+            filter_params[key] = float(value)
+    blacklist = pop_option(args, "--blacklist")
+    if blacklist is not None:
+        filter_params["blacklist"] = [w.strip() for w in blacklist.split(",") if w.strip()]
+    if "--no-title-dedup" in args:
+        args.remove("--no-title-dedup")
+        filter_params["title_dedup"] = False
+    online = "--online" in args
+    if online:
+        args.remove("--online")
+
+    record = load_record(args[0])
+    recognizer = MusicRecognizer(os.environ.get("ACR_HOST", ""), os.environ.get("ACR_ACCESS_KEY", ""),
+                                 os.environ.get("ACR_ACCESS_SECRET", ""),
+                                 netease_api=os.environ.get("NETEASE_API_BASE", "http://localhost:3000"),
+                                 filter_params=filter_params)
+    result = recognizer.reprocess(record["acr_raw"], record.get("netease_raw"), offline=not online)
+    print(json.dumps(to_jsonable({
+        "video_url": record.get("video_url"),
+        "filter_params": filter_params,
+        "tracks_found": result["tracks_found"],
+        "debug_log": result["debug_log"],
+        "reprocess_ms": result["reprocess_ms"]
+    }), ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""Time-sharded recognition of long audio across worker processes or nodes.
+
+A long section is split into shards that own disjoint runs of window starts on
+the single-worker grid (every 15s from the section start). Each shard's audio
+runs one window length past its last start, so neighbouring shards overlap by
+the boundary window and every window hears exactly the audio it would in a
+single-worker scan. Shards only identify windows; the merge step collects their
+responses and MusicRecognizer._replay_windows() runs winner selection over them
+in timeline order, so aggregation sees the same candidates as a sequential run.
+
+Two runners:
+  process pool   run_shards_local(): ProcessPoolExecutor on this machine
+  shared queue   ShardQueue: a directory (local disk, or a mount shared by several
+                 nodes). Workers started with `python sharding.py worker <dir>`
+                 claim tasks by atomic rename; the submitting job works the queue
+                 too, so it completes even when no worker is running.
+
+Queue workers read ACR_HOST / ACR_ACCESS_KEY / ACR_ACCESS_SECRET / ACR_UPLOAD_PROFILE
+from their own environment; credentials are never written to the queue. A queue
+serves one ACR project: jobs only use it when their access key is the queue's
+(queue_key), and workers refuse tasks stamped with a different key. Workers
+on one host share the per-key ACR rate limiter (rate_limiter.py); separate nodes
+each have their own bucket, so size ACR_RATE_LIMIT_QPS per node accordingly.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import tempfile
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+
+from recognizer import MusicRecognizer
+from records import compact_acr_response
+
+DEFAULT_SHARD_SECONDS = 600
+# A claimed task without a result after this long is assumed lost (worker died)
+CLAIM_TIMEOUT = float(os.environ.get("SHARD_CLAIM_TIMEOUT", 900))
+
+def plan_shards(starts, shard_ms, segment_len=15 * 1000):
+    """Split window starts (ms, ascending) into shards of about `shard_ms` each.
+
+    Returns [{"starts", "audio_start_ms", "audio_end_ms"}, ...]; the audio span
+    covers the shard's windows including the tail of the last one.
+    """
+    shards, current = [], []
+    for start in starts:
+        if current and start - current[0] >= shard_ms:
+            shards.append(current)
+            current = []
+        current.append(start)
+    if current:
+        shards.append(current)
+    return [{"starts": s, "audio_start_ms": s[0], "audio_end_ms": s[-1] + segment_len} for s in shards]
+
+def env_recognizer_kwargs():
+    return {
+        "acr_host": os.environ.get("ACR_HOST", ""),
+        "acr_key": os.environ.get("ACR_ACCESS_KEY", ""),
+        "acr_secret": os.environ.get("ACR_ACCESS_SECRET", ""),
+        "upload_profile": os.environ.get("ACR_UPLOAD_PROFILE", "original"),
+        "retain_raw": os.environ.get("RETAIN_RAW_RESULTS") == "1",
+    }
+
+def recognize_shard(task, recognizer_kwargs=None):
+    """Worker: identify every window of one shard. Top-level so it can be pickled.
+
+    Returns {"task_id", "index", "offset_ms", "windows": [{"timestamp_ms", "response",
+    "seg_bytes", "latency_ms"}, ...], "seconds", "worker"} or the same keys with "error".
+    """
+    from pydub import AudioSegment
+    t0 = time.time()
+    shard = {"task_id": task["task_id"], "index": task["index"], "offset_ms": task["offset_ms"],
+             "worker": f"{socket.gethostname()}:{os.getpid()}"}
+    try:
+        recognizer = MusicRecognizer(**(recognizer_kwargs or env_recognizer_kwargs()))
+        # Without this, every window would come back as a -1 "Missing credentials"
+        # response and the job would finish with zero tracks instead of failing
+        if not (recognizer.acr_host and recognizer.acr_key and recognizer.acr_secret):
+            raise ValueError("no ACR credentials in this worker")
+        if task.get("acr_key") and task["acr_key"] != recognizer.acr_key:
+            raise ValueError("task belongs to a different ACR access key")
+        audio = AudioSegment.from_file(task["audio_path"])
+        windows = []
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for start in task["starts"]:
+                timestamp_ms = task["offset_ms"] + start
+                acr_res, seg_bytes, latency_ms = recognizer._identify_window(
+                    audio, start - task["audio_start_ms"], temp_dir, timestamp_ms, task["segment_len"])
+                windows.append({"timestamp_ms": timestamp_ms,
+                                "response": acr_res if recognizer.retain_raw else compact_acr_response(acr_res),
+                                "seg_bytes": seg_bytes, "latency_ms": latency_ms})
+        shard["windows"] = windows
+    except Exception as e:
+        shard["error"] = f"Shard {task['index']} failed: {e}"
+    shard["seconds"] = round(time.time() - t0, 2)
+    return shard
+
+def merge_shard_windows(shard_results):
+    """Per-shard window lists -> [(section_offset_ms, windows in timeline order), ...].
+
+    A window reported twice (a requeued task that its first worker finished after
+    all) is kept once, from the lower shard index.
+    """
+    sections = {}
+    for shard in sorted(shard_results, key=lambda s: s["index"]):
+        by_ts = sections.setdefault(shard["offset_ms"], {})
+        for window in shard["windows"]:
+            by_ts.setdefault(window["timestamp_ms"], window)
+    return [(offset_ms, [by_ts[ts] for ts in sorted(by_ts)]) for offset_ms, by_ts in sorted(sections.items())]
+
+def run_shards_local(tasks, recognizer_kwargs, workers=None):
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(tasks))) as pool:
+        return list(pool.map(recognize_shard, tasks, repeat(recognizer_kwargs)))
+
+class ShardQueue:
+    """Directory-backed task queue: tasks/ -> claimed/ (atomic rename) -> results/"""
+
+    def __init__(self, root, claim_timeout=CLAIM_TIMEOUT):
+        self.root = root
+        self.claim_timeout = claim_timeout
+        for name in ("tasks", "claimed", "results", "audio"):
+            os.makedirs(os.path.join(root, name), exist_ok=True)
+
+    def _path(self, kind, task_id):
+        return os.path.join(self.root, kind, f"{task_id}.json")
+
+    def _write(self, kind, task_id, payload):
+        tmp = os.path.join(self.root, kind, f".{task_id}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(payload, f)
+        os.replace(tmp, self._path(kind, task_id))
+
+    def audio_dir(self, job_id):
+        path = os.path.join(self.root, "audio", job_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def submit(self, task):
+        self._write("tasks", task["task_id"], task)
+
+    def claim(self, job_id=None):
+        """Take the next pending task (optionally only `job_id`'s); None if there is none"""
+        for name in sorted(os.listdir(os.path.join(self.root, "tasks"))):
+            if name.startswith(".") or (job_id and not name.startswith(job_id)):
+                continue
+            claimed = os.path.join(self.root, "claimed", name)
+            try:
+                os.rename(os.path.join(self.root, "tasks", name), claimed)
+            except FileNotFoundError:
+                continue  # another worker was faster
+            os.utime(claimed)  # claim time, for requeue_stale
+            with open(claimed) as f:
+                return json.load(f)
+        return None
+
+    def complete(self, task, result):
+        self._write("results", task["task_id"], result)
+        try:
+            os.remove(self._path("claimed", task["task_id"]))
+        except FileNotFoundError:
+            pass
+
+    def result(self, task_id):
+        try:
+            with open(self._path("results", task_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def requeue_stale(self, job_id):
+        cutoff = time.time() - self.claim_timeout
+        for name in os.listdir(os.path.join(self.root, "claimed")):
+            path = os.path.join(self.root, "claimed", name)
+            try:
+                if name.startswith(job_id) and os.path.getmtime(path) < cutoff:
+                    os.rename(path, os.path.join(self.root, "tasks", name))
+            except FileNotFoundError:
+                continue
+
+    def cleanup(self, job_id):
+        for kind in ("tasks", "claimed", "results"):
+            directory = os.path.join(self.root, kind)
+            for name in os.listdir(directory):
+                if name.startswith(job_id):
+                    try:
+                        os.remove(os.path.join(directory, name))
+                    except FileNotFoundError:
+                        pass
+        shutil.rmtree(os.path.join(self.root, "audio", job_id), ignore_errors=True)
+
+def run_shards_queue(queue, tasks, recognizer_kwargs, poll=0.5):
+    """Publish `tasks` (all from one job) and collect their results, working the
+    queue from this process whenever none of them is finished yet"""
+    job_id = tasks[0]["job_id"]
+    for task in tasks:
+        queue.submit(task)
+    pending = {task["task_id"] for task in tasks}
+    results = []
+    while pending:
+        for task_id in list(pending):
+            result = queue.result(task_id)
+            if result is not None:
+                results.append(result)
+                pending.discard(task_id)
+        if not pending:
+            break
+        task = queue.claim(job_id)
+        if task:
+            queue.complete(task, recognize_shard(task, recognizer_kwargs))
+        else:
+            queue.requeue_stale(job_id)
+            time.sleep(poll)
+    return results
+
+def run_queue_worker(root, poll=1.0, once=False):
+    """Serve shard tasks from the queue at `root` until interrupted (or, with
+    `once`, until it is empty)"""
+    queue = ShardQueue(root)
+    while True:
+        task = queue.claim()
+        if task:
+            result = recognize_shard(task)
+            queue.complete(task, result)
+            print(f"{task['task_id']}: {len(result.get('windows', []))} windows in {result['seconds']}s"
+                  + (f" ({result['error']})" if "error" in result else ""), flush=True)
+        elif once:
+            return
+        else:
+            time.sleep(poll)
+
+def main():
+    args = sys.argv[1:]
+    if len(args) < 2 or args[0] != "worker":
+        print("Usage: python sharding.py worker <queue_dir> [--once]")
+        return
+    run_queue_worker(args[1], once="--once" in args)
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,30 @@
 import os
+import time
 import tempfile
-from yt_dlp import YoutubeDL
-import requests
+import threading
 import mimetypes
+from recognizer import download_profile_opts, download_throughput, export_for_upload
+from rate_limiter import get_rate_limiter, is_rate_limited, backoff_delay
+from audio_cache import get_audio_cache
+from circuit_breaker import get_circuit_breaker
 
-def download_audio(url, out_dir):
+def download_audio(url, out_dir, download_profile=None):
+    from yt_dlp import YoutubeDL
     base = os.path.join(out_dir, "audio")
     ydl_opts = {
         "format": "bestaudio/best",
         "outtmpl": base + ".%(ext)s",
         "quiet": True,
     }
+    ydl_opts.update(download_profile_opts(download_profile or os.environ.get("YTDLP_DOWNLOAD_PROFILE")))
     cookiefile = os.environ.get("YTDLP_COOKIEFILE")
     if cookiefile and os.path.exists(cookiefile):
         ydl_opts["cookiefile"] = cookiefile
+    cache = get_audio_cache()
+    cache_key = cache.key(url, "download_audio:" + ydl_opts["format"]) if cache else None
+    hit = cache.get(cache_key, out_dir) if cache else None
+    if hit:
+        return hit[0][0][1]
     try:
         with YoutubeDL(ydl_opts) as ydl:
             ydl.download([url])
@@ -22,10 +33,13 @@ def download_audio(url, out_dir):
     for ext in ("webm", "m4a", "mp3", "opus", "aac"):
         p = base + f".{ext}"
         if os.path.exists(p):
+            if cache:
+                cache.put(cache_key, [(0, p)])
             return p
     return base
 
-def slice_segments(audio_path, segment_ms=15000, step_ms=10000, max_segments=20):
+def slice_segments(audio_path, segment_ms=15000, step_ms=10000, max_segments=20, upload_profile=None):
+    profile = upload_profile or os.environ.get("ACR_UPLOAD_PROFILE", "wav")
     try:
         from pydub import AudioSegment
         segments = []
@@ -35,29 +49,39 @@ def slice_segments(audio_path, segment_ms=15000, step_ms=10000, max_segments=20)
         while t < len(audio) and i < max_segments:
             end = min(t + segment_ms, len(audio))
             seg = audio[t:end]
-            tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-            seg.export(tmp.name, format="wav")
-            segments.append(tmp.name)
+            tmp = tempfile.NamedTemporaryFile(delete=False)
+            tmp.close()
+            path, _ = export_for_upload(seg, tmp.name, profile)
+            os.remove(tmp.name)
+            segments.append(path)
             i += 1
             t += step_ms
         return segments or [audio_path]
     except Exception:
         return [audio_path]
 
-def acr_recognize(wav_path):
-    host = os.environ.get("ACR_HOST", "")
-    key = os.environ.get("ACR_ACCESS_KEY", "")
-    secret = os.environ.get("ACR_ACCESS_SECRET", "")
-    if not host or not key or not secret:
-        return None
-    import hmac, hashlib, base64, time
-    ts = str(int(time.time()))
-    try:
-        sb = str(os.path.getsize(wav_path))
-    except Exception:
-        sb = ""
-    ct = mimetypes.guess_type(wav_path)[0] or "audio/mpeg"
-    files = {"sample": (os.path.basename(wav_path), open(wav_path, "rb"), ct)}
+# ACR statuses that condemn a host/signature combination: HTTP error (3000), missing or
+# invalid access key (3001), invalid signature (3014). Any other status in ACR's JSON
+# (a match, 1001 "No result", 2004 "can't generate fingerprint", ...) proves it works.
+ACR_REJECT_CODES = {3000, 3001, 3014}
+
+def acr_answered(attempt):
+    """Did this combination get through to ACR? True for any ACR status JSON except
+    the auth/signature codes above, and for rate-limit refusals (3003/3015/429): the
+    host and signature are fine, the quota is not, and racing the other combinations
+    would only spend more of it. HTTP errors without JSON and transport failures
+    (code -1) are not answers."""
+    if is_rate_limited(attempt["raw"]):
+        return True
+    code = (attempt["status"] or {}).get("code")
+    return attempt.get("acr_json", False) and code is not None and code not in ACR_REJECT_CODES
+
+# (access key, ACR_HOST) -> (host url, signature version) that last got an answer
+_ACR_WORKING = {}
+_ACR_WORKING_LOCK = threading.Lock()
+
+def acr_candidates(host):
+    """[(host url, signature version), ...] in the historical try order"""
     hosts = []
     if host.startswith("http"):
         hosts.append(host)
@@ -65,34 +89,100 @@ def acr_recognize(wav_path):
         hosts.append("https://" + host)
         if host.endswith(".cn"):
             hosts.append("https://" + host.replace(".cn", ".com"))
-    versions = ["1", "2"]
-    attempts = []
-    for h in hosts:
-        url = f"{h}/v1/identify"
-        for ver in versions:
-            data = {
-                "access_key": key,
-                "data_type": "audio",
-                "signature_version": ver,
-                "timestamp": ts,
-            }
-            if sb:
-                data["sample_bytes"] = sb
-            if ver == "1":
-                sig_str = f"{key}\n{data['data_type']}\n{ver}\n{ts}"
+    return [(h, ver) for h in hosts for ver in ("1", "2")]
+
+def acr_attempt(wav_path, h, ver, key, secret, rate_limit_retries=4):
+    """One host/signature combination, with its own signature timestamp and a freshly
+    opened upload body per request (a shared handle would be at EOF after the first try)"""
+    import hmac, hashlib, base64
+    import requests
+    try:
+        sb = str(os.path.getsize(wav_path))
+    except Exception:
+        sb = ""
+    ct = mimetypes.guess_type(wav_path)[0] or "audio/mpeg"
+    url = f"{h}/v1/identify"
+    limiter = get_rate_limiter(key)
+    for retry in range(rate_limit_retries + 1):
+        limiter.acquire()
+        ts = str(int(time.time()))
+        data = {
+            "access_key": key,
+            "data_type": "audio",
+            "signature_version": ver,
+            "timestamp": ts,
+        }
+        if sb:
+            data["sample_bytes"] = sb
+        if ver == "1":
+            sig_str = f"{key}\n{data['data_type']}\n{ver}\n{ts}"
+        else:
+            sig_str = f"{key}\n{sb}\n{ts}"
+        data["signature"] = base64.b64encode(hmac.new(secret.encode(), sig_str.encode(), digestmod=hashlib.sha1).digest()).decode()
+        acr_json = False
+        try:
+            with open(wav_path, "rb") as f:
+                r = requests.post(url, data=data, files={"sample": (os.path.basename(wav_path), f, ct)}, timeout=30)
+            if r.headers.get("content-type","" ).startswith("application/json"):
+                obj = r.json()
+                acr_json = isinstance(obj.get("status"), dict)
             else:
-                sig_str = f"{key}\n{sb}\n{ts}"
-            sign = base64.b64encode(hmac.new(secret.encode(), sig_str.encode(), digestmod=hashlib.sha1).digest()).decode()
-            data["signature"] = sign
-            try:
-                r = requests.post(url, data=data, files=files, timeout=30)
-                obj = r.json() if r.headers.get("content-type","" ).startswith("application/json") else {"status":{"code":r.status_code},"error":r.text}
-            except Exception as e:
-                obj = {"status": {"code": -1}, "error": str(e)}
-            attempts.append({"host": h, "version": ver, "sig_str": sig_str, "status": obj.get("status"), "raw": obj})
-            if obj.get("status", {}).get("code") == 0:
-                return obj
-    return {"status": {"code": attempts[-1]["status"]["code"] if attempts else -1}, "attempts": attempts}
+                obj = {"status":{"code":r.status_code},"error":r.text}
+        except Exception as e:
+            obj = {"status": {"code": -1}, "error": str(e)}
+        if not is_rate_limited(obj) or retry == rate_limit_retries:
+            break
+        limiter.backoff(backoff_delay(retry))
+    return {"host": h, "version": ver, "sig_str": sig_str, "status": obj.get("status"), "raw": obj,
+            "acr_json": acr_json}
+
+def acr_recognize(wav_path, rate_limit_retries=4):
+    """Identify one segment.
+
+    The host/signature combination that last answered for these credentials is
+    tried first, so the steady state is one request per segment. When there is
+    none yet (or it failed on auth, signature or transport), the remaining
+    combinations are raced concurrently and the first one that answers is
+    remembered. A rate-limited answer keeps the cached combination.
+    """
+    host = os.environ.get("ACR_HOST", "")
+    key = os.environ.get("ACR_ACCESS_KEY", "")
+    secret = os.environ.get("ACR_ACCESS_SECRET", "")
+    if not host or not key or not secret:
+        return None
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    cache_key = (key, host)
+    candidates = acr_candidates(host)
+    attempts = []
+
+    with _ACR_WORKING_LOCK:
+        working = _ACR_WORKING.get(cache_key)
+    if working in candidates:
+        attempt = acr_attempt(wav_path, *working, key, secret, rate_limit_retries)
+        attempts.append(attempt)
+        if acr_answered(attempt):
+            return attempt["raw"]
+        # Auth / signature / transport failure: forget it and race the others
+        with _ACR_WORKING_LOCK:
+            if _ACR_WORKING.get(cache_key) == working:
+                del _ACR_WORKING[cache_key]
+        candidates = [c for c in candidates if c != working]
+
+    pool = ThreadPoolExecutor(max_workers=len(candidates))
+    try:
+        futures = {pool.submit(acr_attempt, wav_path, h, ver, key, secret, rate_limit_retries): (h, ver)
+                   for h, ver in candidates}
+        for fut in as_completed(futures):
+            attempt = fut.result()
+            attempts.append(attempt)
+            if acr_answered(attempt):
+                with _ACR_WORKING_LOCK:
+                    _ACR_WORKING[cache_key] = futures[fut]
+                return attempt["raw"]
+    finally:
+        # Slower duplicates finish in the background; their answers are not needed
+        pool.shutdown(wait=False)
+    return {"status": {"code": (attempts[-1]["status"] or {}).get("code", -1) if attempts else -1}, "attempts": attempts}
 
 def parse_acr_result(obj):
     res = []
@@ -107,9 +197,18 @@ def parse_acr_result(obj):
     return res
 
 def search_netease(keywords, api_base):
+    """{"matches", "raw"}; "unavailable": True when the service is down (or its circuit is open)"""
+    import requests
+    breaker = get_circuit_breaker(api_base)
+    if not breaker.allow():
+        return {"matches": [], "raw": {"circuit": "open"}, "unavailable": True}
     q = {"keywords": keywords, "limit": 5}
     try:
         r = requests.get(f"{api_base}/search", params=q, timeout=15)
+        if r.status_code >= 500:
+            breaker.record_failure()
+            return {"matches": [], "raw": {"status": r.status_code}, "unavailable": True}
+        breaker.record_success()
         if r.status_code != 200:
             return {"matches": [], "raw": {"status": r.status_code}}
         data = r.json()
@@ -123,15 +222,122 @@ def search_netease(keywords, api_base):
                 "album": (s.get("album") or {}).get("name")
             })
         return {"matches": out, "raw": data}
+    except requests.RequestException:
+        breaker.record_failure()
+        return {"matches": [], "raw": {}, "unavailable": True}
     except Exception:
         return {"matches": [], "raw": {}}
 
+def read_batch_urls(source):
+    """URLs from a file ('-' = stdin): one per line, blank lines and '#' comments
+    skipped, duplicates dropped (first occurrence wins)"""
+    import sys
+    fh = sys.stdin if source == "-" else open(source, encoding="utf-8")
+    try:
+        urls = [line.strip() for line in fh]
+    finally:
+        if fh is not sys.stdin:
+            fh.close()
+    return list(dict.fromkeys(u for u in urls if u and not u.startswith("#")))
+
+def load_checkpoint(path):
+    """URLs already finished by an earlier run (one per line)"""
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+def _batch_job(index, url, api_base=None, download_profile=None):
+    """One batch item; top-level so ProcessPoolExecutor can pickle it"""
+    t0 = time.time()
+    try:
+        result = analyze_video(url, api_base, download_profile)
+        return {"index": index, "url": url, "seconds": round(time.time() - t0, 2), "result": result}
+    except Exception as e:
+        return {"index": index, "url": url, "seconds": round(time.time() - t0, 2), "error": str(e)}
+
+def run_batch(urls, workers=4, executor="process", output=None, checkpoint=None, api_base=None, download_profile=None):
+    """Analyze many URLs in parallel, writing one JSON line per URL as soon as it finishes.
+
+    executor: "process" (separate interpreters, CPU-bound decode/encode scales) or
+    "thread" (cheaper, enough when the run is download/ACR bound). ACR calls from
+    every worker still go through the shared per-key rate limiter.
+    checkpoint: file of finished URLs; URLs listed there are skipped, so an
+    interrupted run resumes where it stopped. Failed URLs are not checkpointed
+    and are retried on the next run. Returns (done, failed, skipped).
+    """
+    import sys
+    import json
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+    finished = load_checkpoint(checkpoint)
+    todo = [(i, u) for i, u in enumerate(urls) if u not in finished]
+    skipped = len(urls) - len(todo)
+    done = failed = 0
+    out = open(output, "a", encoding="utf-8") if output else sys.stdout
+    ckpt = open(checkpoint, "a", encoding="utf-8") if checkpoint else None
+    pool_cls = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+    pool = pool_cls(max_workers=max(1, workers))
+    try:
+        futures = [pool.submit(_batch_job, i, u, api_base, download_profile) for i, u in todo]
+        for fut in as_completed(futures):
+            item = fut.result()
+            out.write(json.dumps(item, ensure_ascii=False) + "\n")
+            out.flush()
+            if "error" in item:
+                failed += 1
+                continue
+            done += 1
+            if ckpt:
+                # Written only after the result line is flushed: a crash in between repeats the URL, never loses it
+                ckpt.write(item["url"] + "\n")
+                ckpt.flush()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        if ckpt:
+            ckpt.close()
+        if output:
+            out.close()
+    return done, failed, skipped
+
+BATCH_USAGE = """Usage: python video_music_recognizer.py <video_url>
+       python video_music_recognizer.py --batch <urls.txt | -> [--workers N] [--executor process|thread]
+                                        [--output results.jsonl] [--checkpoint done.txt]
+
+Batch mode streams one JSON line per URL. --checkpoint defaults to <output>.done
+when --output is given; rerunning the same command skips URLs that already finished."""
+
 def main():
     import sys
-    if len(sys.argv) < 2:
-        print("Usage: python video_music_recognizer.py <video_url>")
+    args = sys.argv[1:]
+    if not args:
+        print(BATCH_USAGE)
         return
-    url = sys.argv[1]
+    if "--batch" in args:
+        options = {}
+        for flag, key, cast in (("--batch", "source", str), ("--workers", "workers", int),
+                                ("--executor", "executor", str), ("--output", "output", str),
+                                ("--checkpoint", "checkpoint", str)):
+            if flag in args:
+                i = args.index(flag)
+                options[key] = cast(args[i + 1])
+                del args[i:i + 2]
+        if options.get("executor", "process") not in ("process", "thread"):
+            print(BATCH_USAGE)
+            return
+        if options.get("output") and "checkpoint" not in options:
+            options["checkpoint"] = options["output"] + ".done"
+        urls = read_batch_urls(options.pop("source"))
+        try:
+            done, failed, skipped = run_batch(urls, **options)
+        except KeyboardInterrupt:
+            print("Interrupted; rerun the same command to resume.", file=sys.stderr)
+            sys.exit(130)
+        print(f"Batch finished: {done} done, {failed} failed, {skipped} skipped (checkpoint)", file=sys.stderr)
+        if failed:
+            sys.exit(1)
+        return
+    url = args[0]
     api_base = os.environ.get("NETEASE_API_BASE", "http://localhost:3000")
     with tempfile.TemporaryDirectory() as td:
         mp3 = download_audio(url, td)
@@ -153,15 +359,17 @@ def main():
         for it in found:
             kws = it["title"] + (" " + it["artists"] if it["artists"] else "")
             matches = search_netease(kws, api_base)
-            print(f"[{kws}]")
-            for m in matches:
+            print(f"[{kws}]" + (" (Netease unavailable)" if matches.get("unavailable") else ""))
+            for m in matches["matches"]:
                 print(f"  - {m['name']} | {m['artists']} | {m['album']} | id={m['id']}")
 
-def analyze_video(url, api_base=None):
+def analyze_video(url, api_base=None, download_profile=None):
     api = api_base or os.environ.get("NETEASE_API_BASE", "http://localhost:3000")
     acr_host = os.environ.get("ACR_HOST", "")
     with tempfile.TemporaryDirectory() as td:
-        mp3 = download_audio(url, td)
+        t0 = time.time()
+        mp3 = download_audio(url, td, download_profile)
+        download_seconds = time.time() - t0
         size_bytes = 0
         duration_ms = None
         try:
@@ -190,8 +398,9 @@ def analyze_video(url, api_base=None):
         for it in found:
             kws = it["title"] + (" " + it["artists"] if it["artists"] else "")
             matches = search_netease(kws, api)
-            out.append({"query": kws, "matches": matches["matches"], "raw": matches["raw"]})
-        return {"tracks": found, "netease": out, "api_base": api, "segments": len(segs), "acr": acr_details, "acr_host": acr_host, "download": {"path": mp3, "bytes": size_bytes, "duration_ms": duration_ms}}
+            out.append({"query": kws, "matches": matches["matches"], "raw": matches["raw"],
+                        "unavailable": matches.get("unavailable", False)})
+        return {"tracks": found, "netease": out, "api_base": api, "segments": len(segs), "acr": acr_details, "acr_host": acr_host, "download": {"path": mp3, "bytes": size_bytes, "duration_ms": duration_ms, "seconds": round(download_seconds, 2), "throughput_kbps": download_throughput(size_bytes, download_seconds)}}
 
 if __name__ == "__main__":
     main()
@@ -1,18 +1,43 @@
-from flask import Flask, request, render_template, jsonify, redirect, url_for
+from flask import Flask, Response, request, render_template, jsonify, redirect, url_for
 import os
 import sys
+import heapq
+import itertools
 import threading
 import uuid
 import time
+import gzip
+import hmac
+import json
+import hashlib
+import tempfile
+from collections import OrderedDict
+from contextlib import contextmanager
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from recognizer import MusicRecognizer
+from recognizer import MusicRecognizer, DOWNLOAD_PROFILES, warm_up
+from records import JobLog, LOG_LEVELS, to_jsonable
+from job_profiler import StackSampler, format_top
+
+try:
+    import brotli
+except ImportError:  # optional: /api/result then only offers gzip
+    brotli = None
 
 app = Flask(__name__)
 
 # In-memory job store (Note: This will be cleared if app restarts)
 JOBS = {}
 
+# Raw ACR / Netease responses of finished jobs are also written here, so
+# /api/reprocess and reprocess.py can re-run the filtering after a restart
+JOB_STORE_DIR = os.environ.get("JOB_STORE_DIR") or os.path.join(tempfile.gettempdir(), "video_music_jobs")
+
+# Admin-only features (per-job profiling) need this token; unset = disabled
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", 5))
+PROFILE_TOP_N = int(os.environ.get("PROFILE_TOP_N", 40))
+
 # Helper to get env vars
 def get_config():
     return {
@@ -20,31 +45,320 @@ def get_config():
         "ACR_ACCESS_KEY": os.environ.get("ACR_ACCESS_KEY", ""),
         "ACR_ACCESS_SECRET": os.environ.get("ACR_ACCESS_SECRET", ""),
         "NETEASE_API": os.environ.get("NETEASE_API_BASE", "http://localhost:3000"),
-        "COOKIES_PATH": os.environ.get("YTDLP_COOKIEFILE", "")
+        "COOKIES_PATH": os.environ.get("YTDLP_COOKIEFILE", ""),
+        "UPLOAD_PROFILE": os.environ.get("ACR_UPLOAD_PROFILE", "original")
     }
 
+def parse_clock(value):
+    """'1:02:03' / '62:03' / '3723' -> seconds"""
+    seconds = 0.0
+    for part in value.strip().split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+def parse_time_ranges(text):
+    """'0:00-10:00, 1:00:00-1:05:00' -> [(0, 600), (3600, 3900)]"""
+    ranges = []
+    for chunk in text.split(','):
+        if not chunk.strip():
+            continue
+        start, end = chunk.split('-', 1)
+        ranges.append((parse_clock(start), parse_clock(end)))
+    return ranges
+
+def parse_sample_plan(text):
+    """'10:00/1:00' -> {"every": 600, "length": 60} (take 1 minute out of every 10)"""
+    every, length = text.split('/', 1)
+    return {"every": parse_clock(every), "length": parse_clock(length)}
+
+def hedge_options():
+    """ACR request hedging from the environment: ACR_HEDGE_BUDGET (e.g. 0.1 = at most
+    10% extra identify calls; unset/0 = off) and optional ACR_HEDGE_HOSTS (comma-separated)"""
+    budget = float(os.environ.get("ACR_HEDGE_BUDGET") or 0)
+    if budget <= 0:
+        return None
+    hosts = [h.strip() for h in os.environ.get("ACR_HEDGE_HOSTS", "").split(',') if h.strip()]
+    return {"budget": budget, "hosts": hosts}
+
+def shard_options():
+    """Parallel time shards for long videos (see sharding.py): SHARD_WORKERS processes
+    (unset/0 = off) or a SHARD_QUEUE_DIR shared with `sharding.py worker` processes,
+    SHARD_SECONDS per shard (default 600). The queue's workers use SHARD_QUEUE_ACR_KEY
+    (default: ACR_ACCESS_KEY); jobs submitted with other credentials shard locally."""
+    workers = int(os.environ.get("SHARD_WORKERS") or 0)
+    queue_dir = os.environ.get("SHARD_QUEUE_DIR", "").strip()
+    if not workers and not queue_dir:
+        return None
+    return {"workers": workers or None, "queue_dir": queue_dir or None,
+            "queue_key": os.environ.get("SHARD_QUEUE_ACR_KEY") or os.environ.get("ACR_ACCESS_KEY"),
+            "shard_seconds": float(os.environ.get("SHARD_SECONDS") or 600)}
+
+def job_options(config_overrides):
+    """Split a job's config into (MusicRecognizer kwargs, process_video kwargs)"""
+    recognizer_kwargs = {
+        "acr_host": config_overrides.get('acr_host'),
+        "acr_key": config_overrides.get('acr_key'),
+        "acr_secret": config_overrides.get('acr_secret'),
+        "netease_api": config_overrides.get('netease_api'),
+        "upload_profile": config_overrides.get('upload_profile') or "original",
+        "hedge": hedge_options(),
+        # Full ACR payloads in job results are opt-in (RETAIN_RAW_RESULTS=1), see records.py
+        "retain_raw": os.environ.get("RETAIN_RAW_RESULTS") == "1",
+    }
+    video_kwargs = {
+        "cookies_path": config_overrides.get('cookies_path'),
+        "proxy": config_overrides.get('proxy'),
+        "download_mode": config_overrides.get('download_mode') or "full",
+        "time_ranges": config_overrides.get('time_ranges'),
+        "sample_plan": config_overrides.get('sample_plan'),
+        "download_profile": config_overrides.get('download_profile'),
+        "max_acr_calls": config_overrides.get('max_acr_calls'),
+        "quick": config_overrides.get('quick'),
+        "use_chapters": bool(config_overrides.get('use_chapters')),
+        "shards": shard_options(),
+    }
+    return recognizer_kwargs, video_kwargs
+
+def job_record_path(job_id):
+    return os.path.join(JOB_STORE_DIR, f"{job_id}.json")
+
+def save_job_record(job_id, result):
+    """Persist what reprocessing needs: raw per-window ACR responses + Netease lookups"""
+    if not result.get("acr_raw"):
+        return False
+    try:
+        os.makedirs(JOB_STORE_DIR, exist_ok=True)
+        tmp = job_record_path(job_id) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(to_jsonable({
+                "job_id": job_id,
+                "video_url": JOBS[job_id].get("url"),
+                "acr_raw": result["acr_raw"],
+                "netease_raw": result.get("netease_raw", {}),
+                "download_info": result.get("download_info", {})
+            }), f, ensure_ascii=False)
+        os.replace(tmp, job_record_path(job_id))
+        return True
+    except OSError as e:
+        print(f"Could not persist job {job_id}: {e}")
+        return False
+
+def load_job_record(job_id):
+    """Job record from memory, else from JOB_STORE_DIR; None if unknown"""
+    result = (JOBS.get(job_id) or {}).get("result")
+    if result and result.get("acr_raw"):
+        return {"acr_raw": result["acr_raw"], "netease_raw": result.get("netease_raw", {})}
+    if not os.path.basename(job_id) == job_id:
+        return None
+    try:
+        with open(job_record_path(job_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def is_admin(data=None):
+    """X-Admin-Token header (or, for form posts, an admin_token field in `data`) matches
+    ADMIN_TOKEN. Never read from the query string: URLs end up in logs and Referers."""
+    token = request.headers.get("X-Admin-Token") or (data.get("admin_token") if data is not None else "") or ""
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(str(token).strip(), ADMIN_TOKEN)
+
+def job_profile_path(job_id):
+    return os.path.join(JOB_STORE_DIR, f"{job_id}.profile.json")
+
+@contextmanager
+def job_profile(job_id, enabled):
+    """Sample the current (job) thread while the body runs; the summary is stored
+    on the job and written next to its record in JOB_STORE_DIR"""
+    if not enabled:
+        yield
+        return
+    sampler = StackSampler(interval=PROFILE_INTERVAL_MS / 1000).start()
+    try:
+        yield
+    finally:
+        profile = sampler.stop().summary(PROFILE_TOP_N)
+        JOBS[job_id]["profile"] = profile
+        try:
+            os.makedirs(JOB_STORE_DIR, exist_ok=True)
+            with open(job_profile_path(job_id), "w") as f:
+                json.dump(profile, f)
+        except OSError as e:
+            print(f"Could not persist profile of job {job_id}: {e}")
+
+def load_job_profile(job_id):
+    profile = (JOBS.get(job_id) or {}).get("profile")
+    if profile or os.path.basename(job_id) != job_id:
+        return profile
+    try:
+        with open(job_profile_path(job_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def finish_job(job_id, result):
+    job = JOBS[job_id]
+    if "error" in result:
+        job["error"] = result["error"]
+    elif save_job_record(job_id, result) and "acr_raw" in result:
+        # Per-window responses live on disk from here on (load_job_record), not in JOBS
+        del result["acr_raw"]
+    job["result"] = result
+    job["finished_at"] = time.time()
+    # Last: pollers treat "done" as final and cache what they see
+    job["status"] = "done"
+
 def process_task(job_id, video_url, config_overrides):
     try:
-        # Extract config
-        acr_host = config_overrides.get('acr_host')
-        acr_key = config_overrides.get('acr_key')
-        acr_secret = config_overrides.get('acr_secret')
-        cookies_path = config_overrides.get('cookies_path')
-        netease_api = config_overrides.get('netease_api')
-        proxy = config_overrides.get('proxy')
-
-        recognizer = MusicRecognizer(acr_host, acr_key, acr_secret, netease_api)
-        result = recognizer.process_video(video_url, cookies_path, proxy)
-        
-        JOBS[job_id]["status"] = "done"
-        JOBS[job_id]["result"] = result
-        
-        if "error" in result:
-             JOBS[job_id]["error"] = result["error"]
+        recognizer_kwargs, video_kwargs = job_options(config_overrides)
+        recognizer = MusicRecognizer(**recognizer_kwargs)
+        with job_profile(job_id, config_overrides.get("profile")):
+            result = recognizer.process_video(video_url, **video_kwargs)
+        finish_job(job_id, result)
 
     except Exception as e:
+        JOBS[job_id]["error"] = str(e)
         JOBS[job_id]["status"] = "error"
+
+# Optional asyncio worker (RECOGNIZER_ASYNC=1): all jobs share one event loop thread,
+# so dozens of jobs can wait on ACR/Netease without an OS thread each.
+_async_loop = None
+_async_loop_lock = threading.Lock()
+
+def get_async_loop():
+    import asyncio
+    global _async_loop
+    with _async_loop_lock:
+        if _async_loop is None:
+            _async_loop = asyncio.new_event_loop()
+            threading.Thread(target=_async_loop.run_forever, daemon=True).start()
+        return _async_loop
+
+async def process_task_async(job_id, video_url, config_overrides):
+    try:
+        from async_recognizer import AsyncMusicRecognizer
+        recognizer_kwargs, video_kwargs = job_options(config_overrides)
+        video_kwargs.pop("shards")  # the async worker already overlaps a job's ACR calls
+        recognizer = AsyncMusicRecognizer(**recognizer_kwargs)
+        finish_job(job_id, await recognizer.process_video_async(video_url, **video_kwargs))
+
+    except Exception as e:
         JOBS[job_id]["error"] = str(e)
+        JOBS[job_id]["status"] = "error"
+
+def start_job(job_id, video_url, config_overrides, on_done=None):
+    # Profiled jobs always get their own thread, so the sampler sees only that job
+    if os.environ.get("RECOGNIZER_ASYNC") == "1" and not config_overrides.get("profile"):
+        import asyncio
+        future = asyncio.run_coroutine_threadsafe(process_task_async(job_id, video_url, config_overrides), get_async_loop())
+        if on_done:
+            future.add_done_callback(lambda f: on_done())
+        return
+
+    def run():
+        try:
+            process_task(job_id, video_url, config_overrides)
+        finally:
+            if on_done:
+                on_done()
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+
+class JobScheduler:
+    """Shortest-job-first dispatch with aging: queued jobs start in order of probed
+    duration minus `aging` seconds per second already waited, at most `max_running`
+    at a time. Short clips overtake long mixes, but every job's priority keeps rising,
+    so a 3-hour mix (or an unprobed job, counted as `unknown_duration`) cannot be
+    starved by a steady stream of short clips.
+
+    All queued jobs age at the same rate, so `duration - aging * (now - queued_at)`
+    orders like the static `duration + aging * queued_at`, which the heap stores."""
+
+    def __init__(self, max_running, aging=2.0, unknown_duration=1800):
+        self.max_running = max_running
+        self.aging = aging
+        self.unknown_duration = unknown_duration
+        self._heap = []
+        self._seq = itertools.count()
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def submit(self, job_id, video_url, config_overrides, duration=None):
+        with self._lock:
+            priority = (duration if duration is not None else self.unknown_duration) + self.aging * time.time()
+            heapq.heappush(self._heap, (priority, next(self._seq), job_id, video_url, config_overrides))
+        self._dispatch()
+
+    def position(self, job_id):
+        with self._lock:
+            order = [entry[2] for entry in sorted(self._heap)]
+        return order.index(job_id) + 1 if job_id in order else 0
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                if self._running >= self.max_running or not self._heap:
+                    return
+                _, _, job_id, video_url, config_overrides = heapq.heappop(self._heap)
+                self._running += 1
+            JOBS[job_id]["status"] = "processing"
+            JOBS[job_id]["started_time"] = time.time()
+            start_job(job_id, video_url, config_overrides, on_done=self._done)
+
+    def _done(self):
+        with self._lock:
+            self._running -= 1
+        self._dispatch()
+
+SCHEDULER = JobScheduler(int(os.environ.get("MAX_CONCURRENT_JOBS", 4)),
+                         aging=float(os.environ.get("SCHEDULER_AGING", 2.0)),
+                         unknown_duration=float(os.environ.get("SCHEDULER_UNKNOWN_DURATION", 1800)))
+
+# Optional warm-up (WARMUP_ON_START=1): load yt-dlp/pydub/requests in the background
+# right after boot, so the first job doesn't pay for them and health checks stay instant
+WARMUP = {"done": False, "seconds": None}
+
+def run_warm_up():
+    try:
+        WARMUP["seconds"] = round(warm_up(extractors=True), 3)
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+    WARMUP["done"] = True
+
+if os.environ.get("WARMUP_ON_START") == "1":
+    threading.Thread(target=run_warm_up, daemon=True).start()
+
+# Duration-based strategy thresholds (seconds)
+MAX_VIDEO_DURATION = int(os.environ.get("MAX_VIDEO_DURATION", 0))        # 0 = no limit
+# Automatic quick mode stops after the first song, which drops the rest of a short
+# medley, so it is opt-in (e.g. QUICK_MAX_DURATION=300); 0 = only when requested
+QUICK_MAX_DURATION = int(os.environ.get("QUICK_MAX_DURATION", 0))        # short clips: single-song quick mode
+# The automatic budget samples long mixes and skips songs the same way, so it is opt-in
+# too (e.g. BUDGET_MIN_DURATION=3600); it never replaces a sharded full scan
+BUDGET_MIN_DURATION = int(os.environ.get("BUDGET_MIN_DURATION", 0))      # long mixes: budgeted scan
+BUDGET_ACR_CALLS = int(os.environ.get("BUDGET_ACR_CALLS", 240))
+
+def choose_strategy(probe, config_overrides):
+    """Pick quick / full / budgeted scan from the probed duration (explicit choices win)"""
+    explicit = ("quick", "max_acr_calls", "use_chapters", "time_ranges", "sample_plan")
+    if any(config_overrides.get(k) for k in explicit):
+        return "custom"
+    duration = (probe or {}).get("duration")
+    if not duration:
+        return "full"
+    if duration <= QUICK_MAX_DURATION:
+        # Reported as "quick" in /api/status and on the result page
+        config_overrides["quick"] = {"agree": 3, "min_score": 70}
+        return "quick"
+    if BUDGET_MIN_DURATION and duration >= BUDGET_MIN_DURATION and not shard_options():
+        config_overrides["max_acr_calls"] = BUDGET_ACR_CALLS
+        return "budgeted"
+    return "full"
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    return jsonify({"status": "ok", "warm": WARMUP["done"], "warm_up_seconds": WARMUP["seconds"]})
 
 @app.route('/', methods=['GET'])
 def index():
@@ -61,7 +375,7 @@ def index():
                 error = job["error"]
         elif job["status"] == "error":
             error = job.get("error", "Unknown error")
-        elif job["status"] == "processing":
+        elif job["status"] in ("queued", "processing"):
             # If still processing, just show loading or similar
             # But usually frontend handles this. If user refreshes, we might want to show "Still processing"
             pass
@@ -74,7 +388,10 @@ def index():
         # But for clarity, let's redirect to clean URL.
         return redirect(url_for('index'))
     
-    return render_template('index.html', result=result, error=error, config=config, job_id=job_id)
+    profiled = bool(job_id and JOBS[job_id].get("profile"))
+    strategy = JOBS[job_id].get("strategy") if job_id else None
+    return render_template('index.html', result=result, error=error, config=config, job_id=job_id, profiled=profiled,
+                           strategy=strategy)
 
 @app.route('/result', methods=['POST'])
 def handle_form_submit():
@@ -95,17 +412,31 @@ def handle_form_submit():
     cookies_path = data.get('cookies_path', '').strip() or config["COOKIES_PATH"]
     netease_api = data.get('netease_api', '').strip() or config["NETEASE_API"]
     proxy = data.get('proxy', '').strip()
+    download_mode = data.get('download_mode', '').strip() or "full"
+    time_ranges_text = data.get('time_ranges', '').strip()
+    sample_plan_text = data.get('sample_plan', '').strip()
+    profile_name = data.get('download_profile', '').strip() or "default"
+    rate_limit = data.get('rate_limit', '').strip()
+    upload_profile = data.get('upload_profile', '').strip() or config["UPLOAD_PROFILE"]
+    max_acr_calls = str(data.get('max_acr_calls', '')).strip()
+    quick_mode = str(data.get('quick_mode', '')).strip().lower() in ("1", "on", "true")
+    use_chapters = str(data.get('use_chapters', '')).strip().lower() in ("1", "on", "true")
+    profile_job = str(data.get('profile', '')).strip().lower() in ("1", "on", "true")
 
     if not video_url:
         return jsonify({"status": "error", "message": "请输入视频网址"}), 400
     elif not (acr_host and acr_key and acr_secret):
         return jsonify({"status": "error", "message": "请配置 ACRCloud 凭据 (Host/Key/Secret)"}), 400
 
-    job_id = str(uuid.uuid4())
-    JOBS[job_id] = {
-        "status": "processing",
-        "start_time": time.time()
-    }
+    try:
+        time_ranges = parse_time_ranges(time_ranges_text) if time_ranges_text else None
+        sample_plan = parse_sample_plan(sample_plan_text) if sample_plan_text else None
+    except ValueError:
+        return jsonify({"status": "error", "message": "时间范围或采样计划格式错误 (例: 0:00-10:00, 10:00/1:00)"}), 400
+    if max_acr_calls and not max_acr_calls.isdigit():
+        return jsonify({"status": "error", "message": "ACR 调用预算必须是正整数"}), 400
+    if profile_job and not is_admin(data):
+        return jsonify({"status": "error", "message": "性能分析仅限管理员 (需要正确的 ADMIN_TOKEN)"}), 403
 
     config_overrides = {
         "acr_host": acr_host,
@@ -113,12 +444,39 @@ def handle_form_submit():
         "acr_secret": acr_secret,
         "cookies_path": cookies_path,
         "netease_api": netease_api,
-        "proxy": proxy
+        "proxy": proxy,
+        "download_mode": download_mode,
+        "time_ranges": time_ranges,
+        "sample_plan": sample_plan,
+        "download_profile": dict(DOWNLOAD_PROFILES.get(profile_name, {}), rate_limit=rate_limit or None),
+        "upload_profile": upload_profile,
+        "max_acr_calls": int(max_acr_calls) if max_acr_calls else None,
+        "quick": {"agree": 3, "min_score": 70} if quick_mode else None,
+        "use_chapters": use_chapters,
+        "profile": profile_job
     }
 
-    thread = threading.Thread(target=process_task, args=(job_id, video_url, config_overrides))
-    thread.daemon = True
-    thread.start()
+    # Metadata probe before queueing: duration drives ordering, strategy and rejection
+    probe = None
+    try:
+        probe = MusicRecognizer(acr_host, acr_key, acr_secret).probe_video(video_url, cookies_path, proxy)
+    except Exception as e:
+        print(f"Probe failed for {video_url}: {e}")
+    if probe and probe["is_live"]:
+        return jsonify({"status": "error", "message": "直播流请使用 live_recognizer.py 持续识别, 或在直播结束后提交回放"}), 400
+    if probe and MAX_VIDEO_DURATION and (probe["duration"] or 0) > MAX_VIDEO_DURATION:
+        return jsonify({"status": "error", "message": f"视频过长 ({int(probe['duration'])//60} 分钟), 上限为 {MAX_VIDEO_DURATION//60} 分钟"}), 400
+
+    job_id = str(uuid.uuid4())
+    JOBS[job_id] = {
+        "status": "queued",
+        "url": video_url,
+        "start_time": time.time(),
+        "probe": probe,
+        "strategy": choose_strategy(probe, config_overrides)
+    }
+
+    SCHEDULER.submit(job_id, video_url, config_overrides, duration=(probe or {}).get("duration"))
 
     return jsonify({
         "status": "success",
@@ -134,7 +492,213 @@ def check_status(job_id):
     job = JOBS[job_id]
     return jsonify({
         "status": job["status"],
-        "error": job.get("error")
+        "error": job.get("error"),
+        "strategy": job.get("strategy"),
+        "duration": (job.get("probe") or {}).get("duration"),
+        "queue_position": SCHEDULER.position(job_id) if job["status"] == "queued" else 0
+    })
+
+# /api/result paging defaults and caps
+RESULT_PAGE_DEFAULTS = {"tracks": 100, "log": 200}
+RESULT_PAGE_MAX = 1000
+# Encoded bodies of finished jobs, shared LRU across all jobs (0 = no caching)
+RESULT_CACHE_ENTRIES = int(os.environ.get("RESULT_CACHE_ENTRIES", 64))
+_result_cache = OrderedDict()
+_result_cache_lock = threading.Lock()
+
+def result_cache_get(key):
+    with _result_cache_lock:
+        cached = _result_cache.get(key)
+        if cached is not None:
+            _result_cache.move_to_end(key)
+        return cached
+
+def result_cache_put(key, value):
+    if RESULT_CACHE_ENTRIES <= 0:
+        return
+    with _result_cache_lock:
+        _result_cache[key] = value
+        _result_cache.move_to_end(key)
+        while len(_result_cache) > RESULT_CACHE_ENTRIES:
+            _result_cache.popitem(last=False)
+
+def page_args(name):
+    """(offset, limit) from ?<name>_offset= / ?<name>_limit=, clamped"""
+    try:
+        offset = max(0, int(request.args.get(f"{name}_offset", 0)))
+        limit = int(request.args.get(f"{name}_limit", RESULT_PAGE_DEFAULTS[name]))
+    except ValueError:
+        raise ValueError(f"{name}_offset / {name}_limit must be integers")
+    return offset, min(max(limit, 0), RESULT_PAGE_MAX)
+
+def negotiate_encoding():
+    accepted = {part.split(';')[0].strip().lower() for part in request.headers.get("Accept-Encoding", "").split(',')}
+    if brotli and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+def encode_body(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+def log_levels_arg():
+    """?log_level=warning,reject -> ("warning", "reject"); None = all levels"""
+    text = request.args.get("log_level", "").strip()
+    if not text:
+        return None
+    levels = tuple(sorted({level.strip() for level in text.split(',') if level.strip()}))
+    if any(level not in LOG_LEVELS for level in levels):
+        raise ValueError(f"log_level must be one of {', '.join(LOG_LEVELS)}")
+    return levels
+
+def log_entries(log):
+    """Structured debug log ({"t_ms", "level", "msg"}); plain lists count as info"""
+    if isinstance(log, JobLog):
+        return log.entries()
+    return [{"t_ms": None, "level": "info", "msg": line} for line in log or []]
+
+def result_page(job_id, job, tracks_page, log_page):
+    result = job.get("result") or {}
+    tracks = result.get("tracks_found") or []
+    (t_off, t_lim), (l_off, l_lim, levels) = tracks_page, log_page
+    log = log_entries(result.get("debug_log"))
+    if levels:
+        log = [entry for entry in log if entry["level"] in levels]
+    summary = {k: result[k] for k in ("segments_processed", "download_info", "upload", "coverage", "early_exit",
+                                      "hedge", "netease_status") if k in result}
+    return to_jsonable(dict(summary, **{
+        "status": job["status"],
+        "job_id": job_id,
+        "strategy": job.get("strategy"),
+        "error": job.get("error"),
+        "tracks": {"total": len(tracks), "offset": t_off, "limit": t_lim, "items": tracks[t_off:t_off + t_lim]},
+        "debug_log": {"total": len(log), "offset": l_off, "limit": l_lim, "levels": levels,
+                      "dropped": getattr(result.get("debug_log"), "dropped", 0), "items": log[l_off:l_off + l_lim]},
+    }))
+
+@app.route('/api/result/<job_id>', methods=['GET'])
+def get_result(job_id):
+    """Job result as JSON, paged and compressed.
+
+    ?tracks_offset= &tracks_limit= &log_offset= &log_limit= page the track list and
+    the debug log, whose items are {"t_ms", "level", "msg"} entries (?log_level=warning,reject
+    keeps only those levels; lines dropped by the log's ring buffer are counted).
+    Bodies are gzip/br encoded per Accept-Encoding and carry an ETag; a finished
+    job answers If-None-Match with 304 before anything is serialized.
+    """
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({"status": "not_found"}), 404
+    try:
+        tracks_page, log_page = page_args("tracks"), page_args("log") + (log_levels_arg(),)
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    encoding = negotiate_encoding()
+    # finished_at is set before the status flips; without it the job is not final yet
+    done = job["status"] == "done" and job.get("finished_at") is not None
+
+    # A finished job never changes, so its ETag is known without building the body
+    cache_key = (job_id, job.get("finished_at"), tracks_page, log_page, encoding)
+    if done:
+        version = f"{job_id}:{job.get('finished_at')}:{tracks_page}:{log_page}"
+        etag = '"' + hashlib.sha1(version.encode()).hexdigest()[:20] + (f"-{encoding}" if encoding else "") + '"'
+    else:
+        etag = None
+
+    if_none_match = {t.strip().removeprefix("W/") for t in request.headers.get("If-None-Match", "").split(',') if t.strip()}
+    if etag and (etag in if_none_match or "*" in if_none_match):
+        response = Response(status=304)
+    else:
+        cached = result_cache_get(cache_key) if done else None
+        if cached is None:
+            body = json.dumps(result_page(job_id, job, tracks_page, log_page), ensure_ascii=False).encode()
+            if etag is None:
+                etag = '"' + hashlib.sha1(body).hexdigest()[:20] + (f"-{encoding}" if encoding else "") + '"'
+                if etag in if_none_match:
+                    return Response(status=304, headers={"ETag": etag, "Vary": "Accept-Encoding"})
+            cached = (etag, encode_body(body, encoding))
+            if done:
+                result_cache_put(cache_key, cached)
+        etag, payload = cached
+        response = Response(payload, mimetype="application/json")
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+    response.headers["ETag"] = etag
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "private, max-age=300" if done else "no-cache"
+    return response
+
+@app.route('/api/profile/<job_id>', methods=['GET'])
+def download_profile(job_id):
+    """Admin only. ?format=collapsed (flame graph input, default), top (text table,
+    ?n= rows) or json (full summary)"""
+    if not is_admin():
+        return jsonify({"status": "error", "message": "forbidden"}), 403
+    profile = load_job_profile(job_id)
+    if profile is None:
+        return jsonify({"status": "not_found"}), 404
+    fmt = request.args.get("format", "collapsed")
+    if fmt == "json":
+        return jsonify(profile)
+    if fmt == "top":
+        try:
+            n = int(request.args.get("n", PROFILE_TOP_N))
+        except ValueError:
+            return jsonify({"status": "error", "message": "n must be an integer"}), 400
+        body, filename = format_top(profile["top"][:n]), f"{job_id}.top.txt"
+    elif fmt == "collapsed":
+        body, filename = profile["collapsed"], f"{job_id}.collapsed.txt"
+    else:
+        return jsonify({"status": "error", "message": "format must be collapsed, top or json"}), 400
+    return Response(body, mimetype="text/plain",
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+@app.route('/api/reprocess/<job_id>', methods=['POST'])
+def reprocess_job(job_id):
+    """Re-run filtering/aggregation of a finished job with new parameters, without
+    touching YouTube or ACRCloud.
+
+    JSON body (all optional): min_score, netease_min_score, blacklist (list or
+    comma-separated string), title_dedup, offline (default true: Netease answers
+    only from the stored lookups).
+    """
+    record = load_job_record(job_id)
+    if record is None:
+        return jsonify({"status": "not_found"}), 404
+
+    data = request.get_json(silent=True) or {}
+    filter_params = {}
+    try:
+        for key in ("min_score", "netease_min_score"):
+            if data.get(key) not in (None, ""):
+                filter_params[key] = float(data[key])
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "error": "min_score / netease_min_score must be numbers"}), 400
+    blacklist = data.get("blacklist")
+    if isinstance(blacklist, str):
+        blacklist = [w.strip() for w in blacklist.split(',') if w.strip()]
+    if blacklist is not None:
+        filter_params["blacklist"] = blacklist
+    if "title_dedup" in data:
+        filter_params["title_dedup"] = bool(data["title_dedup"])
+
+    config = get_config()
+    recognizer = MusicRecognizer(config["ACR_HOST"], config["ACR_ACCESS_KEY"], config["ACR_ACCESS_SECRET"],
+                                 netease_api=config["NETEASE_API"], filter_params=filter_params)
+    result = recognizer.reprocess(record["acr_raw"], record.get("netease_raw"),
+                                  offline=data.get("offline", True) is not False)
+    return jsonify({
+        "status": "success",
+        "job_id": job_id,
+        "filter_params": filter_params,
+        "tracks_found": to_jsonable(result["tracks_found"]),
+        "debug_log": list(result["debug_log"]),
+        "reprocess_ms": result["reprocess_ms"]
     })
 
 if __name__ == '__main__':